@@ -9,9 +9,9 @@ other Python files.
 import disnake
 
 import configparser
-import sqlite3
 
 from mythical.bot import Bot
+from mythical.database import Database
 from mythical.plugin.raider import RaiderPlugin
 from mythical.plugin.faceit import FaceitPlugin
 from mythical.plugin.valorant import ValorantPlugin
@@ -21,7 +21,7 @@ from mythical.plugin.siege import SiegePlugin
 config = configparser.ConfigParser()
 config.read("mythical.conf")
 
-connection = sqlite3.connect("mythical.sqlite3")
+database = Database("mythical.sqlite3")
 intents = disnake.Intents(
     messages=True,
     message_content=True,
@@ -35,10 +35,10 @@ bot = Bot(
     config["discord"].get("prefix", "%"),
     intents=intents,
     plugins={
-        "raider": lambda b: RaiderPlugin(b, connection),
-        "faceit": lambda b: FaceitPlugin(b, connection),
-        "valorant": lambda b: ValorantPlugin(b, connection),
-        "siege": lambda b: SiegePlugin(b, connection),
+        "raider": lambda b: RaiderPlugin(b, database),
+        "faceit": lambda b: FaceitPlugin(b, database),
+        "valorant": lambda b: ValorantPlugin(b, database),
+        "siege": lambda b: SiegePlugin(b, database),
         "height": HeightPlugin,
         "length": LengthPlugin,
     },
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, Mapping, Optional, Tuple
+
+import aiohttp
+import orjson
+
+
+class RateLimiter:
+    """Token bucket that smooths out bursts of API requests.
+
+    Holds up to `rate` tokens, refilled continuously at `rate` per
+    `period` seconds. Each request spends one token and waits when the
+    bucket is empty rather than tripping the API's own limit.
+    """
+
+    rate: float
+    period: float
+    tokens: float
+    updated: float
+    lock: asyncio.Lock
+
+    def __init__(self, rate: float, period: float = 1.0):
+        """Start with a full bucket."""
+
+        self.rate = rate
+        self.period = period
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and spend it."""
+
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.period)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) * self.period / self.rate)
+
+
+# Longest we'll hold a caller's slot waiting out a 429; anything longer
+# is returned to the caller instead
+MAX_RETRY_AFTER = 60.0
+
+
+def retry_after(headers: Mapping[str, str], attempt: int) -> float:
+    """Seconds to wait before retrying a rate limited request."""
+
+    try:
+        return float(headers["Retry-After"])
+    except (KeyError, ValueError):
+        return 2.0 ** attempt
+
+
+async def get_json(
+    session: aiohttp.ClientSession,
+    url: str,
+    limiter: Optional[RateLimiter] = None,
+    retries: int = 3,
+) -> Tuple[int, Optional[Any]]:
+    """GET a JSON document, backing off whenever we get a 429.
+
+    Returns the final status code along with the decoded body, which
+    is only present if the request succeeded. A 429 asking us to wait
+    longer than `MAX_RETRY_AFTER` is returned as is.
+    """
+
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            await limiter.acquire()
+
+        async with session.get(url) as response:
+            if response.status == 200:
+                return response.status, orjson.loads(await response.read())
+            if response.status != 429 or attempt == retries:
+                return response.status, None
+            delay = retry_after(response.headers, attempt)
+            if not 0 <= delay <= MAX_RETRY_AFTER:
+                return response.status, None
+
+        await asyncio.sleep(delay)
@@ -1,9 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import configparser
-import pprint
+import random
 import re
-import sys
 import traceback
 from typing import Dict, Callable, Tuple, Iterable, Coroutine, Optional, Any, TypeVar
 
@@ -11,6 +11,24 @@ import disnake
 
 T = TypeVar("T")
 
+MENTION = re.compile(r"<@!?([0-9]{17,19})>$")
+
+# Embed colors for rating notifications
+GAIN = disnake.Colour.brand_green()
+LOSS = disnake.Colour.brand_red()
+
+# Roast whoever tops a leaderboard; formatted with their `name`
+LEADERBOARD_FOOTERS = (
+    "{name} needs to go outside",
+    "{name} should probably touch grass",
+    "{name} might need to take a break",
+    "{name} hasn't showered in days",
+    "{name} is losing their grip",
+    "{name} definitely isn't short",
+    "Somebody should check on {name}",
+    "I can smell {name} from here",
+)
+
 
 def split(text: str) -> Tuple[str, str]:
     """Split into subcommand, rest. Default empty string."""
@@ -24,6 +42,12 @@ def split(text: str) -> Tuple[str, str]:
         return items[0], items[1]
 
 
+def leaderboard_footer(name: str) -> str:
+    """Pick a random footer for the leaderboard."""
+
+    return random.choice(LEADERBOARD_FOOTERS).format(name=name)
+
+
 def either(names: Iterable[str]) -> str:
     """Format a series of strings in code blocks."""
 
@@ -58,12 +82,15 @@ class BotPlugin:
         self.bot = bot
         self.commands = {}
 
-    def configure(self, section: Optional[configparser.SectionProxy]) -> None:
+    def configure(self, section: Optional[Dict[str, str]]) -> None:
         """Take options from relevant section."""
 
     async def on_ready(self) -> None:
         """Called when the client is ready."""
 
+    async def close(self) -> None:
+        """Called when the client is shutting down."""
+
     async def on_message(self, text: str, message: disnake.Message):
         """Handle subcommand from raw text."""
 
@@ -78,6 +105,22 @@ class BotPlugin:
                 f"missing subcommand, try {either(self.commands)}"
             )
 
+    async def broadcast(self, channels: Iterable[disnake.abc.Messageable], **kwargs: Any) -> None:
+        """Send the same message to several channels concurrently.
+
+        Sends share the bot's semaphore to stay under Discord's rate
+        limits, and a failed send is logged without stopping the rest.
+        """
+
+        async def send(channel: disnake.abc.Messageable) -> None:
+            async with self.bot.sends:
+                await channel.send(**kwargs)
+
+        results = await asyncio.gather(*map(send, channels), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                await self.on_exception(result)
+
     async def on_exception(self, exception: Exception) -> None:
         """Pass the exception up to the bot for logging."""
 
@@ -90,6 +133,7 @@ class Bot(disnake.Client):
     prefix: str
     plugins: Dict[str, BotPlugin]
     debug_id: int | None
+    sends: asyncio.Semaphore
 
     def __init__(self, prefix: str, plugins: dict[str, Any], **kwargs):
         """Set plugins, start loops."""
@@ -99,6 +143,7 @@ class Bot(disnake.Client):
         self.plugins = {name: constructor(self) for name, constructor in plugins.items()}
         self.token = None
         self.debug_id = None
+        self.sends = asyncio.Semaphore(10)
 
     def configure(self, config: configparser.ConfigParser):
         """Propagate config sections to plugins."""
@@ -106,8 +151,10 @@ class Bot(disnake.Client):
         self.token = config["discord"]["token"]
         debug_id = config["discord"].get("debug_id")
         self.debug_id = int(debug_id) if debug_id is not None else None
+        # Hand plugins plain dictionaries so they don't hold on to the
+        # parser or pay for interpolation on every lookup
         for name, plugin in self.plugins.items():
-            plugin.configure(config[name] if config.has_section(name) else None)
+            plugin.configure(dict(config[name]) if config.has_section(name) else None)
 
     def run(self, *args: Any, **kwargs: Any) -> None:
         """Pass token if it's been configured."""
@@ -115,6 +162,30 @@ class Bot(disnake.Client):
         token = {"token": self.token} if self.token is not None else {}
         return super().run(*args, **kwargs, **token)
 
+    async def close(self) -> None:
+        """Give each plugin a chance to release resources."""
+
+        for plugin in self.plugins.values():
+            await plugin.close()
+        await super().close()
+
+    async def resolve_channel(self, channel_id: int) -> Optional[disnake.abc.Messageable]:
+        """Get a channel from the client cache or else the API.
+
+        Channels in guilds that haven't been cached yet come back as
+        None from `get_channel`, so fall back to fetching them before
+        giving up.
+        """
+
+        channel = self.get_channel(channel_id)
+        if channel is not None:
+            return channel
+
+        try:
+            return await self.fetch_channel(channel_id)
+        except (disnake.NotFound, disnake.Forbidden):
+            return None
+
     async def on_ready(self):
         """Set up each plugin."""
 
@@ -145,11 +216,12 @@ class Bot(disnake.Client):
         """Called by methods wrapped with `handle_exception`."""
 
         formatted_exception = "".join(traceback.format_exception(exception)).rstrip()
-        frame = sys.exc_info()[2]
 
+        # Keep the whole message under Discord's 2000 character limit
+        # no matter how long the exception's own message is
         channel = self.get_channel(self.debug_id)
         if channel is not None:
-            await channel.send(f"Error: {exception}\n```{formatted_exception[:1000]}```")
+            await channel.send(f"Error: {str(exception)[:500]}\n```{formatted_exception[:1000]}```")
         else:
             print(f"Could not find channel {self.debug_id}!")
 
@@ -160,7 +232,7 @@ class Bot(disnake.Client):
 def try_get_member(argument: str, message: disnake.Message) -> Optional[disnake.Member]:
     """Try to discern a member from an argument."""
 
-    match = re.match(r"<@!?([0-9]{17,19})>$", argument)
+    match = MENTION.match(argument)
     if match is not None:
         return message.guild.get_member(int(match.group(1)))
     else:
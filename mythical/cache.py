@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """Remember the results of slow lookups for a short time.
+
+    Entries are `(value, timestamp)` pairs keyed by lookup arguments.
+    Lookups of the same key are serialized on a per-key lock, so when
+    several callers miss at once only the first actually awaits the
+    factory and the rest pick up its result. If `maxsize` is set, the
+    least recently used entries are evicted past that many.
+    """
+
+    ttl: float
+    expiry: float
+    maxsize: Optional[int]
+    entries: Dict[K, Tuple[V, float]]
+    locks: Dict[K, asyncio.Lock]
+
+    def __init__(self, ttl: float, expiry: Optional[float] = None, maxsize: Optional[int] = None):
+        """Values are fresh for `ttl` seconds and dropped after `expiry`."""
+
+        self.ttl = ttl
+        self.expiry = expiry if expiry is not None else 5 * ttl
+        self.maxsize = maxsize
+        self.entries = {}
+        self.locks = {}
+
+    async def get(self, key: K, factory: Callable[[], Awaitable[V]]) -> V:
+        """Return a fresh cached value or await `factory` for a new one."""
+
+        lock = self.locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Dictionaries keep insertion order, so reinserting a key on
+            # every hit leaves the least recently used entry first.
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[1] > time.monotonic() - self.ttl:
+                self.entries[key] = entry
+                return entry[0]
+
+            value = await factory()
+            now = time.monotonic()
+            self.entries[key] = value, now
+
+        self.prune(now)
+        return value
+
+    def prune(self, now: float) -> None:
+        """Drop stale and excess entries along with their idle locks."""
+
+        for key, (_, timestamp) in list(self.entries.items()):
+            if timestamp < now - self.expiry:
+                del self.entries[key]
+        if self.maxsize is not None:
+            while len(self.entries) > self.maxsize:
+                del self.entries[next(iter(self.entries))]
+        for key, lock in list(self.locks.items()):
+            if key not in self.entries and not lock.locked():
+                del self.locks[key]
@@ -0,0 +1,101 @@
+import contextlib
+import queue
+import sqlite3
+import threading
+from typing import Iterator
+
+# Write-ahead logging lets readers run alongside the writer and turns
+# each commit into an append rather than a rollback journal fsync.
+PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",
+    "temp_store=MEMORY",
+    "cache_size=-65536",
+    "mmap_size=268435456",
+    "busy_timeout=5000",
+    "foreign_keys=ON",
+)
+
+
+class Database:
+    """One writer connection and a small pool of readers.
+
+    Trackers are called from worker threads, so every connection is
+    opened with `check_same_thread=False`. Writes are serialized on a
+    lock around the single writer; reads check out their own connection
+    so they never queue behind a write.
+    """
+
+    path: str
+    size: int
+    writer: sqlite3.Connection
+    readers: "queue.Queue[sqlite3.Connection]"
+    lock: threading.Lock
+
+    def __init__(self, path: str, size: int = 4):
+        """Open the writer and `size` idle readers."""
+
+        self.path = path
+        self.size = size
+        self.lock = threading.Lock()
+        self.writer = self.connect()
+        self.readers = queue.Queue()
+        for _ in range(size):
+            self.readers.put(self.connect())
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a new connection to the database file."""
+
+        # Trackers format their queries once, so the same few strings
+        # come back every call; keep all of them compiled.
+        connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        for pragma in PRAGMAS:
+            connection.execute(f"PRAGMA {pragma}")
+        return connection
+
+    @contextlib.contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Check out a reader, opening a spare if the pool is empty.
+
+        Generators may hold a reader across awaits on the event loop,
+        so we never block waiting for one to come back.
+        """
+
+        try:
+            connection = self.readers.get_nowait()
+        except queue.Empty:
+            connection = self.connect()
+
+        try:
+            yield connection
+        finally:
+            if self.readers.qsize() < self.size:
+                self.readers.put(connection)
+            else:
+                connection.close()
+
+    @contextlib.contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Hold the writer and commit or roll back on exit.
+
+        Connections are in autocommit mode, so we manage transactions
+        ourselves. BEGIN IMMEDIATE takes the write lock up front rather
+        than upgrading partway through, and DDL is covered too.
+        """
+
+        with self.lock:
+            self.writer.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.writer
+                self.writer.execute("COMMIT")
+            except BaseException:
+                # COMMIT itself can fail, e.g. on a full disk; never leave
+                # the shared writer stuck inside a transaction
+                if self.writer.in_transaction:
+                    self.writer.execute("ROLLBACK")
+                raise
@@ -1,99 +1,120 @@
+import aiohttp
 import disnake
-import requests
 from disnake.ext import tasks
 
-import random
-import datetime
-import configparser
-import sqlite3
+import asyncio
+import functools
 from dataclasses import dataclass
-from typing import Optional
+from operator import itemgetter
+from typing import Dict, List, Optional, Tuple
 
-from ..tracker import Tracker, Player
-from ..bot import Bot, BotPlugin, BotError, get_member, handle_exception
+from ..api import RateLimiter, get_json
+from ..cache import TTLCache
+from ..database import Database
+from ..tracker import Tracker, Player, SpectatorChannel
+from ..bot import GAIN, LOSS, Bot, BotPlugin, BotError, get_member, handle_exception, leaderboard_footer
 
 GAME = "cs2"
 
+# Pulls (level, elo) out of a player's per-game data in one call
+LEVEL_ELO = itemgetter("skill_level", "faceit_elo")
 
-def get_faceit_player(key: str, nickname: str) -> dict:
+# Recent results come back as "1" for a win and "0" for a loss
+RECENT_RESULTS = str.maketrans({"1": "W", "0": "L"})
+
+
+async def get_faceit_player(
+    session: aiohttp.ClientSession,
+    nickname: str,
+    limiter: Optional[RateLimiter] = None,
+) -> dict:
     """Get retrieve data with ELO and level."""
 
-    response = requests.get(
+    status, data = await get_json(
+        session,
         f"https://open.faceit.com/data/v4/players?nickname={nickname}",
-        headers={
-            "Accept": "application/json",
-            "Authorization": f"Bearer {key}",
-        },
+        limiter=limiter,
     )
 
-    if response.status_code != 200:
+    if status != 200:
         raise BotError(f"couldn't find player with nickname {nickname}!")
 
-    return response.json()
+    return data
 
 
-def get_faceit_history(key: str, player_id: str, limit: int) -> list:
+async def get_faceit_history(
+    session: aiohttp.ClientSession,
+    player_id: str,
+    limit: int,
+    limiter: Optional[RateLimiter] = None,
+) -> list:
     """Get match history."""
 
-    response = requests.get(
+    status, data = await get_json(
+        session,
         f"https://open.faceit.com/data/v4/players/{player_id}/history?game={GAME}&offset=0&limit={limit}",
-        headers={
-            "Accept": "application/json",
-            "Authorization": f"Bearer {key}",
-        },
+        limiter=limiter,
     )
 
-    if response.status_code != 200:
+    if status != 200:
         raise BotError(f"invalid player id!")
 
-    data = response.json()
     return data["items"]
 
 
-def get_faceit_last_match(key: str, player_id: str) -> Optional[dict]:
+async def get_faceit_last_match(
+    session: aiohttp.ClientSession,
+    player_id: str,
+    limiter: Optional[RateLimiter] = None,
+) -> Optional[dict]:
     """Get the most recent match."""
 
-    data = get_faceit_history(key, player_id, 1)
+    data = await get_faceit_history(session, player_id, 1, limiter=limiter)
     if data:
         return data[0]
     return None
 
 
-def get_faceit_stats(key: str, player_id: str, game_id: str) -> dict:
+async def get_faceit_stats(
+    session: aiohttp.ClientSession,
+    player_id: str,
+    game_id: str,
+    limiter: Optional[RateLimiter] = None,
+) -> dict:
     """Get just stats from match ID."""
 
-    response = requests.get(
+    status, data = await get_json(
+        session,
         f"https://open.faceit.com/data/v4/players/{player_id}/stats/{game_id}",
-        headers={
-            "Accept": "application/json",
-            "Authorization": f"Bearer {key}",
-        },
+        limiter=limiter,
     )
 
-    if response.status_code != 200:
+    if status != 200:
         raise BotError(f"invalid match id!")
 
-    return response.json()
+    return data
 
 
-def get_faceit_match_statistics(key: str, match_id: str) -> Optional[dict]:
+async def get_faceit_match_statistics(
+    session: aiohttp.ClientSession,
+    match_id: str,
+    limiter: Optional[RateLimiter] = None,
+) -> Optional[dict]:
     """Get detailed statistics from a match ID."""
 
-    response = requests.get(
+    status, data = await get_json(
+        session,
         f"https://open.faceit.com/data/v4/matches/{match_id}/stats",
-        headers={
-            "Accept": "application/json",
-            "Authorization": f"Bearer {key}",
-        },
+        limiter=limiter,
     )
 
-    if response.status_code != 200:
+    if status != 200:
         raise BotError(f"invalid match id!")
 
-    return response.json()
+    return data
 
 
-@dataclass
+@dataclass(slots=True)
 class FaceitPlayerStatistics:
     kills: int
     assists: int
@@ -124,32 +145,57 @@ def get_won(match: dict, nickname: str) -> bool:
     return False
 
 
-def get_player_statistics(match_statistics: dict, nickname: str) -> Optional[FaceitPlayerStatistics]:
-    """Get player statistics by nickname."""
-
-    overview = match_statistics["rounds"][0]
-    for team_data in overview["teams"]:
-        for player_data in team_data["players"]:
-            if player_data["nickname"] == nickname:
-                return FaceitPlayerStatistics(
-                    kills=int(player_data["player_stats"]["Kills"]),
-                    assists=int(player_data["player_stats"]["Assists"]),
-                    deaths=int(player_data["player_stats"]["Deaths"]),
-                    hsp=int(player_data["player_stats"]["Headshots %"]),
-                    rounds=int(overview["round_stats"]["Rounds"])
-                )
-    return None
+def index_players(match_statistics: dict) -> Dict[str, dict]:
+    """Map each nickname in a match to their player data."""
+
+    return {
+        player_data["nickname"]: player_data
+        for team_data in match_statistics["rounds"][0]["teams"]
+        for player_data in team_data["players"]
+    }
+
+
+def get_player_statistics(
+    match_statistics: dict,
+    nickname: str,
+    players: Optional[Dict[str, dict]] = None,
+) -> Optional[FaceitPlayerStatistics]:
+    """Get player statistics by nickname.
+
+    Pass `players` from `index_players` to reuse an index across
+    lookups in the same match.
+    """
+
+    if players is None:
+        players = index_players(match_statistics)
+
+    player_data = players.get(nickname)
+    if player_data is None:
+        return None
+
+    stats = player_data["player_stats"]
+    return FaceitPlayerStatistics(
+        kills=int(stats["Kills"]),
+        assists=int(stats["Assists"]),
+        deaths=int(stats["Deaths"]),
+        hsp=int(stats["Headshots %"]),
+        rounds=int(match_statistics["rounds"][0]["round_stats"]["Rounds"])
+    )
+
 
+def format_match_result(match: dict, match_statistics: dict, nickname: str) -> str:
+    """Return whether the player won or lost and the ordered score."""
 
-def format_result(data: dict, won: bool) -> str:
-    """Return win or loss and ordered score."""
+    won = get_won(match, nickname)
 
-    scores = map(int, data["rounds"][0]["round_stats"]["Score"].split(" / "))
-    score = ":".join(map(str, sorted(scores, reverse=won)))
-    return f"won {score}" if won else f"lost {score}"
+    # Winners read high to low and losers low to high
+    a, b = map(int, match_statistics["rounds"][0]["round_stats"]["Score"].split(" / "))
+    if (a > b) != won:
+        a, b = b, a
+    return f"won {a}:{b}" if won else f"lost {a}:{b}"
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class FaceitPlayer(Player):
     """This is a convenience class that mirrors the database record.
 
@@ -169,28 +215,29 @@ class FaceitPlayer(Player):
             "elo INTEGER",
             "UNIQUE (nickname)",
         )
+        indexes = ("elo DESC",)
 
 
 class FaceitTracker(Tracker[FaceitPlayer]):
     """High level database access for raider.io commands.
 
     Abstracts away all the SQL queries we need to persist the state of
-    our notification bot. Requires a sqlite3 connection; it's not our
+    our notification bot. Requires a `Database`; it's not our
     responsibility to create the database file, only to use it.
     """
 
     class Meta:
         model = FaceitPlayer
 
+    @functools.cached_property
+    def _update_level(self) -> str:
+        return f"UPDATE {self._players} SET (level, elo)=(?, ?) WHERE id=?"
+
     def set_level(self, player_id: int, level: int, elo: int):
         """Update a player's rating."""
 
-        with self.connection:
-            cursor = self.connection.cursor()
-            cursor.execute(
-                f"UPDATE {self._players} SET (level, elo)=(?, ?) WHERE id=?",
-                (level, elo, player_id),
-            )
+        with self.transaction() as cursor:
+            cursor.execute(self._update_level, (level, elo, player_id))
 
 
 class FaceitPlugin(BotPlugin):
@@ -198,12 +245,26 @@ class FaceitPlugin(BotPlugin):
 
     tracker: FaceitTracker
     key: str
-
-    def __init__(self, bot: Bot, connection: sqlite3.Connection):
+    session: Optional[aiohttp.ClientSession]
+    workers: int
+    limiter: RateLimiter
+    player_cache: TTLCache[str, dict]
+    stats_cache: TTLCache[str, dict]
+    match_cache: TTLCache[str, Tuple[dict, Dict[str, dict]]]
+
+    def __init__(self, bot: Bot, database: Database):
         """Set command handlers."""
 
         super().__init__(bot)
-        self.tracker = FaceitTracker(connection, prefix="faceit")
+        self.tracker = FaceitTracker(database, prefix="faceit")
+        self.session = None
+        self.workers = 16
+        self.limiter = RateLimiter(10)
+        # Profiles change with every match and lifetime stats a little
+        # less often, but a finished match's statistics never change
+        self.player_cache = TTLCache(ttl=60, maxsize=1024)
+        self.stats_cache = TTLCache(ttl=300, maxsize=1024)
+        self.match_cache = TTLCache(ttl=86400, maxsize=256)
         self.commands = {
             "r": self.command_rating,
             "rating": self.command_rating,
@@ -215,7 +276,7 @@ class FaceitPlugin(BotPlugin):
             "here": self.command_here,
         }
 
-    def configure(self, section: Optional[configparser.SectionProxy]):
+    def configure(self, section: Optional[Dict[str, str]]):
         """Set Faceit API key."""
 
         super().configure(section)
@@ -225,114 +286,216 @@ class FaceitPlugin(BotPlugin):
         self.key = section["key"]
 
     async def on_ready(self):
-        """Start background tasks."""
+        """Open the HTTP session and start background tasks."""
+
+        # Every request carries the same key, so set it once on a
+        # pooled session rather than rebuilding headers per call.
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers={
+                    "Accept": "application/json",
+                    "Authorization": f"Bearer {self.key}",
+                },
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    limit_per_host=16,
+                    keepalive_timeout=75,
+                    ttl_dns_cache=300,
+                ),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
 
         if not self.update.is_running():
             self.update.start()
 
+    async def close(self):
+        """Release pooled HTTP connections."""
+
+        if self.session is not None:
+            await self.session.close()
+
+    async def get_player(self, nickname: str) -> dict:
+        """Cached `get_faceit_player`."""
+
+        return await self.player_cache.get(
+            nickname,
+            lambda: get_faceit_player(self.session, nickname, self.limiter),
+        )
+
+    async def get_stats(self, player_id: str) -> dict:
+        """Cached `get_faceit_stats` for our game."""
+
+        return await self.stats_cache.get(
+            player_id,
+            lambda: get_faceit_stats(self.session, player_id, GAME, self.limiter),
+        )
+
+    async def get_match_statistics(self, match_id: str) -> Tuple[dict, Dict[str, dict]]:
+        """Cached `get_faceit_match_statistics` with its player index.
+
+        Spectated players often queue together, so the nickname index
+        is built once per match and shared by every lookup into it.
+        """
+
+        async def fetch() -> Tuple[dict, Dict[str, dict]]:
+            statistics = await get_faceit_match_statistics(self.session, match_id, self.limiter)
+            return statistics, index_players(statistics)
+
+        return await self.match_cache.get(match_id, fetch)
+
     @tasks.loop(minutes=15)
     @handle_exception
     async def update(self):
         """Update all players, notify if new rating."""
 
-        for player in self.tracker.get_spectated_players():
-            data = get_faceit_player(self.key, player.nickname)
+        # A fixed pool of workers drains a queue of players, so only a
+        # handful of refreshes are in flight no matter how many players
+        # are spectated. Their channels come back in the same query so
+        # notifying needs no more.
+        spectated = await asyncio.to_thread(self.tracker.get_spectated_players_with_channels)
+        queue = asyncio.Queue()
+        for item in spectated.items():
+            queue.put_nowait(item)
+
+        workers = [
+            asyncio.create_task(self.update_worker(queue))
+            for _ in range(min(self.workers, queue.qsize()))
+        ]
+        try:
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def update_worker(self, queue: asyncio.Queue):
+        """Refresh players off the queue until cancelled."""
+
+        while True:
+            item = await queue.get()
             try:
-                level = data["games"]["cs2"]["skill_level"]
-                elo = data["games"]["cs2"]["faceit_elo"]
-                avatar = data["avatar"]
-            except KeyError:
-                continue
-            await self.update_player(player, level, elo, data, avatar)
+                await self.update_one(item)
+            except Exception as exception:
+                # One failure shouldn't stop the rest of the players
+                # from being updated, and neither should failing to
+                # report it; a dead worker would leave the queue unjoined
+                try:
+                    await self.on_exception(exception)
+                except Exception as error:
+                    print(f"failed to report {exception!r}: {error!r}")
+            finally:
+                queue.task_done()
+
+    async def update_one(self, item: Tuple[FaceitPlayer, List[SpectatorChannel]]):
+        """Refresh a single player."""
+
+        player, items = item
+        data = await self.get_player(player.nickname)
+        try:
+            level, elo = LEVEL_ELO(data["games"][GAME])
+            avatar = data["avatar"]
+        except KeyError:
+            return
+        if elo == player.elo:
+            return
+        await self.update_player(player, level, elo, data, avatar, items)
 
     @tasks.loop(hours=24)
     @handle_exception
     async def cleanup(self):
         """Remove players that aren't spectated."""
 
-        self.tracker.delete_players_without_spectator()
-
-    async def update_player(self, player: FaceitPlayer, new_level: int, new_elo: int, data: dict, avatar: str):
-        """Update a player's level and elo and notify."""
-
-        if new_elo != player.elo:
-            self.tracker.set_level(player.id, new_level, new_elo)
-
-            for item in self.tracker.get_spectator_channels(player.id):
-                channel = self.bot.get_channel(item.channel_id)
-                if channel is None:
-                    print(f"invalid channel for guild {item.guild_id}: {item.channel_id}")
-                    continue
-
-                if item.user_id is not None:
-                    member = channel.guild.get_member(item.user_id)
-                    if member is not None:
-                        member_name = f" ({member.name})"
-
-                description = []
-
-                last_match = get_faceit_last_match(self.key, data["player_id"])
-                if last_match:
-                    match_id = last_match["match_id"]
-                    match_url = last_match["faceit_url"].format(lang="en")
-                    last_match_statistics = get_faceit_match_statistics(self.key, match_id)
-                    match_map = last_match_statistics["rounds"][0]["round_stats"]["Map"]
-                    player_statistics = get_player_statistics(last_match_statistics, player.nickname)
-                    result = format_result(last_match_statistics, get_won(last_match, player.nickname))
-                    description.append(
-                        f"{player.nickname} [{result} on {match_map}]({match_url})."
-                        f" They went **{player_statistics.kad}** ({player_statistics.kd} KD, {player_statistics.kpr} KPR)"
-                        f" with **{player_statistics.hsp}%** HS."
-                    )
-
-                sign = "+" if new_elo >= player.elo else "-"
-                description.append(f"Their current ELO is **{str(round(new_elo))}** ({sign}{round(abs(new_elo - player.elo))}).")
-
-                if new_level > player.level:
-                    description.append(f"They are now level {new_level}.")
-
-                reached = (
-                    f"gained {new_elo - player.elo}"
-                    if new_elo >= player.elo else
-                    f"lost {player.elo - new_elo}"
-                )
-                embed = disnake.Embed(
-                    title=f"{player.nickname} {reached} faceit elo",
-                    description=" ".join(description),
-                    color=disnake.Colour.brand_green() if new_elo >= player.elo else disnake.Colour.brand_red(),
-                    # timestamp=datetime.datetime.now(),
-                )
-
-                if avatar:
-                    embed.set_thumbnail(avatar)
-
-                # embed.add_field(name="Previous", value=str(round(player.elo, 1)), inline=True)
-                # embed.add_field(name="Current", value=str(round(new_elo, 1)), inline=True)
-
-                # sign = "+" if new_elo >= player.elo else "-"
-                # embed.add_field(name="Change", value=sign + str(round(abs(new_elo - player.elo), 1)), inline=True)
-
-                await channel.send(embed=embed)
+        await asyncio.to_thread(self.tracker.delete_players_without_spectator)
+
+    async def update_player(
+        self,
+        player: FaceitPlayer,
+        new_level: int,
+        new_elo: int,
+        data: dict,
+        avatar: str,
+        items: Optional[List[SpectatorChannel]] = None,
+    ):
+        """Update a player's level and elo and notify.
+
+        Callers only get here once they've seen the elo change, so
+        nothing below is spent on players that haven't played.
+        """
+
+        await asyncio.to_thread(self.tracker.set_level, player.id, new_level, new_elo)
+
+        # The match summary is the same for every channel, so fetch
+        # and format it once per player rather than once per channel
+        match_line = ()
+        last_match = await get_faceit_last_match(self.session, data["player_id"], self.limiter)
+        if last_match:
+            match_id = last_match["match_id"]
+            match_url = last_match["faceit_url"].format(lang="en")
+            last_match_statistics, players = await self.get_match_statistics(match_id)
+            match_map = last_match_statistics["rounds"][0]["round_stats"]["Map"]
+            player_statistics = get_player_statistics(last_match_statistics, player.nickname, players)
+            result = format_match_result(last_match, last_match_statistics, player.nickname)
+            match_line = (
+                f"{player.nickname} [{result} on {match_map}]({match_url})."
+                f" They went **{player_statistics.kad}** ({player_statistics.kd} KD, {player_statistics.kpr} KPR)"
+                f" with **{player_statistics.hsp}%** HS.",
+            )
+
+        sign = "+" if new_elo >= player.elo else "-"
+        elo_line = f"Their current ELO is **{str(round(new_elo))}** ({sign}{round(abs(new_elo - player.elo))})."
+        level_line = (f"They are now level {new_level}.",) if new_level > player.level else ()
+        description = match_line + (elo_line,) + level_line
+
+        reached = (
+            f"gained {new_elo - player.elo}"
+            if new_elo >= player.elo else
+            f"lost {player.elo - new_elo}"
+        )
+
+        embed = disnake.Embed(
+            title=f"{player.nickname} {reached} faceit elo",
+            description=" ".join(description),
+            color=GAIN if new_elo >= player.elo else LOSS,
+            # timestamp=disnake.utils.utcnow(),
+        )
+
+        if avatar:
+            embed.set_thumbnail(avatar)
+
+        # embed.add_field(name="Previous", value=str(round(player.elo, 1)), inline=True)
+        # embed.add_field(name="Current", value=str(round(new_elo, 1)), inline=True)
+
+        # sign = "+" if new_elo >= player.elo else "-"
+        # embed.add_field(name="Change", value=sign + str(round(abs(new_elo - player.elo), 1)), inline=True)
+
+        if items is None:
+            items = await asyncio.to_thread(list, self.tracker.get_spectator_channels(player.id))
+
+        channels = []
+        for item in items:
+            channel = await self.bot.resolve_channel(item.channel_id)
+            if channel is None:
+                print(f"invalid channel for guild {item.guild_id}: {item.channel_id}")
+            else:
+                channels.append(channel)
+
+        await self.broadcast(channels, embed=embed)
 
     async def command_rating(self, text: str, message: disnake.Message):
         """Respond to rating request."""
 
-        data = get_faceit_player(self.key, text)
+        data = await self.get_player(text)
         nickname = data["nickname"]
-        level = data["games"][GAME]["skill_level"]
-        elo = data["games"][GAME]["faceit_elo"]
+        level, elo = LEVEL_ELO(data["games"][GAME])
         player_id = data["player_id"]
-        stats = get_faceit_stats(self.key, player_id, GAME)
+        stats = await self.get_stats(player_id)
         matches = stats["lifetime"]["Matches"]
         winrate = stats["lifetime"]["Win Rate %"]
         wins = stats["lifetime"]["Wins"]
         headshots = stats["lifetime"]["Average Headshots %"]
         kd = stats["lifetime"]["Average K/D Ratio"]
         results = stats["lifetime"]["Recent Results"]
-        aces = 0
-
-        for segment in stats["segments"]:
-            aces += int(segment["stats"]["Penta Kills"])
+        aces = sum(int(segment["stats"]["Penta Kills"]) for segment in stats["segments"])
 
         page_url = data["faceit_url"].format(lang=data["settings"]["language"])
         embed = disnake.Embed(
@@ -342,19 +505,19 @@ class FaceitPlugin(BotPlugin):
                 f" {kd} K/D, and {headshots}% HS. They've hit {aces} aces."
             ),
             color=0xff5722,
-            timestamp=datetime.datetime.now(),
+            timestamp=disnake.utils.utcnow(),
         )
         embed.add_field("Level", str(level), inline=True)
         embed.add_field("Wins", str(wins), inline=True)
-        embed.add_field("Recent", "".join("W" if r == "1" else "L" for r in results), inline=True)
+        embed.add_field("Recent", "".join(results).translate(RECENT_RESULTS), inline=True)
         embed.set_thumbnail(data["avatar"])
 
         # TODO: messages that include member_name
 
         await message.channel.send(embed=embed)
 
-        player = self.tracker.get_player(nickname=text)
-        if player is not None:
+        player = await asyncio.to_thread(self.tracker.get_player, nickname=text)
+        if player is not None and elo != player.elo:
             await self.update_player(player, level, elo, data, data["avatar"])
 
     async def command_add(self, text: str, message: disnake.Message):
@@ -370,35 +533,36 @@ class FaceitPlugin(BotPlugin):
         else:
             raise BotError("expected `nickname` and optional `server member`!")
 
-        self.tracker.set_channel_if_unset(message.guild.id, message.channel.id)
+        await asyncio.to_thread(self.tracker.set_channel_if_unset, message.guild.id, message.channel.id)
 
-        player = self.tracker.get_player(nickname=nickname)
+        player = await asyncio.to_thread(self.tracker.get_player, nickname=nickname)
         if player is None:
-            data = get_faceit_player(self.key, nickname)
-            level = data["games"][GAME]["skill_level"]
-            elo = data["games"][GAME]["faceit_elo"]
-            player = self.tracker.create_player(nickname=nickname, level=level, elo=elo)
+            data = await self.get_player(nickname)
+            level, elo = LEVEL_ELO(data["games"][GAME])
+            player = await asyncio.to_thread(self.tracker.create_player, nickname=nickname, level=level, elo=elo)
 
-        created = self.tracker.create_spectator(message.guild.id, player.id, user_id)
+        created = await asyncio.to_thread(self.tracker.create_spectator, message.guild.id, player, user_id)
         action = "Started watching" if created else "Already watching"
         await message.channel.send(f"{action} {player.nickname} ({round(player.elo, 1)} elo)")
 
     async def command_remove(self, text: str, message: disnake.Message):
         """Stop spectating a user."""
 
-        player = self.tracker.get_player(nickname=text)
+        player = await asyncio.to_thread(self.tracker.get_player, nickname=text)
         if player is None:
             raise BotError(f"couldn't find player {text}!")
 
-        deleted = self.tracker.delete_spectator(message.guild.id, player.id)
+        deleted = await asyncio.to_thread(self.tracker.delete_spectator, message.guild.id, player.id)
         action = "Stopped watching" if deleted else "Wasn't watching"
         await message.channel.send(f"{action} {player.nickname}")
 
     async def command_leaderboard(self, text: str, message: disnake.Message):
         """List players watched by the guild in order of rating."""
 
-        players = list(self.tracker.get_players_spectated_by_guild(message.guild.id))
-        players.sort(key=lambda item: item.player.elo, reverse=True)
+        players = await asyncio.to_thread(
+            list,
+            self.tracker.get_players_spectated_by_guild(message.guild.id, order_by="elo DESC"),
+        )
 
         lines = []
         for i, item in enumerate(players, start=1):
@@ -413,29 +577,18 @@ class FaceitPlugin(BotPlugin):
             title="Faceit Leaderboard",
             description="\n".join(lines) or "It's a little bit empty in here...",
             color=0xF0C43F,
-            timestamp=datetime.datetime.now(),
+            timestamp=disnake.utils.utcnow(),
         )
 
         # Allow the footer to be empty, in which case we don't set it
         if players:
             first = players[0].player
-            embed.set_footer(text=random.choice(
-                (
-                    f"{first.nickname} needs to go outside",
-                    f"{first.nickname} should probably touch grass",
-                    f"{first.nickname} might need to take a break",
-                    f"{first.nickname} hasn't showered in days",
-                    f"{first.nickname} is losing their grip",
-                    f"{first.nickname} definitely isn't short",
-                    f"Somebody should check on {first.nickname}",
-                    f"I can smell {first.nickname} from here",
-                )
-            ))
+            embed.set_footer(text=leaderboard_footer(first.nickname))
 
         await message.channel.send(embed=embed)
 
     async def command_here(self, text: str, message: disnake.Message):
         """Set the notification channel for this plugin."""
 
-        self.tracker.set_channel(message.guild.id, message.channel.id)
+        await asyncio.to_thread(self.tracker.set_channel, message.guild.id, message.channel.id)
         await message.channel.send("Faceit notifications will be posted to this channel!")
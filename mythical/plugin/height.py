@@ -1,37 +1,55 @@
 import disnake
 
 import abc
-import datetime
+import asyncio
 import random
-import time
 from typing import Generic, TypeVar
 
 from ..bot import Bot, BotPlugin
+from ..cache import TTLCache
 
 T = TypeVar("T")
 
 
-def imperial(inches: int) -> str:
+def _imperial(inches: int) -> str:
     f, i = divmod(inches, 12)
     return f"{f}' {i}\""
 
 
-def metric(inches: int) -> str:
+def _metric(inches: int) -> str:
     cm = int(inches * 2.54)
     return f"{cm} cm"
 
 
+# Heights land well inside this range, so format each one up front
+_IMPERIAL_TABLE = tuple(map(_imperial, range(256)))
+_METRIC_TABLE = tuple(map(_metric, range(256)))
+
+
+def imperial(inches: int) -> str:
+    if 0 <= inches < len(_IMPERIAL_TABLE):
+        return _IMPERIAL_TABLE[inches]
+    return _imperial(inches)
+
+
+def metric(inches: int) -> str:
+    if 0 <= inches < len(_METRIC_TABLE):
+        return _METRIC_TABLE[inches]
+    return _metric(inches)
+
+
 class MeasurePlugin(BotPlugin, Generic[T], abc.ABC):
     """Provide subcommands related to Faceit API."""
 
-    cache: dict[str, tuple[T, float]]
+    cache: TTLCache[str, T]
     cache_time: float = 15 * 60
+    cache_size: int = 4096
 
     def __init__(self, bot: Bot):
         """Set command handlers."""
 
         super().__init__(bot)
-        self.cache = {}
+        self.cache = TTLCache(ttl=self.cache_time, maxsize=self.cache_size)
         self.commands = {
             "r": self.command_rating,
             "rating": self.command_rating,
@@ -54,10 +72,7 @@ class MeasurePlugin(BotPlugin, Generic[T], abc.ABC):
     async def _get_measure(self, name: str) -> T:
         """Call `get_measure` and cache."""
 
-        value = self.cache.get(name)
-        if value is None or value[1] < time.time() - self.cache_time:
-            value = self.cache[name] = await self.get_measure(name), time.time()
-        return value[0]
+        return await self.cache.get(name, lambda: self.get_measure(name))
 
     async def command_rating(self, text: str, message: disnake.Message):
         """Respond to rating request."""
@@ -69,22 +84,27 @@ class MeasurePlugin(BotPlugin, Generic[T], abc.ABC):
     async def command_leaderboard(self, text: str, message: disnake.Message):
         """Respond to rating request."""
 
-        measures = []
-        for member in message.channel.members:
-            if member.status != disnake.Status.offline:
-                measures.append((member.name, self._get_measure(member.name)))
-        measures.sort(key=lambda pair: pair[1], reverse=True)
+        # Look up every online member at once; names are deduplicated
+        # since the cache is keyed by name anyway
+        names = list(dict.fromkeys(
+            member.name
+            for member in message.channel.members
+            if member.status != disnake.Status.offline
+        ))
+        values = await asyncio.gather(*map(self._get_measure, names))
+        measures = sorted(zip(names, values), key=lambda pair: pair[1], reverse=True)
+        formatted = await asyncio.gather(*(self.format_measure(name, measure) for name, measure in measures))
 
         lines = []
-        for i, (name, measure) in enumerate(measures, start=1):
-            lines.append(f"{i}. {name}, {await self.format_measure(name, measure)}")
+        for i, ((name, _), description) in enumerate(zip(measures, formatted), start=1):
+            lines.append(f"{i}. {name}, {description}")
 
         title = await self.get_measure_name()
         embed = disnake.Embed(
             title=f"{title.title()} Leaderboard",
             description="\n".join(lines) or "It's a little bit empty in here...",
             color=0xF0C43F,
-            timestamp=datetime.datetime.now(),
+            timestamp=disnake.utils.utcnow(),
         )
 
         await message.channel.send(embed=embed)
@@ -1,18 +1,46 @@
+import aiohttp
 import disnake
 from disnake.ext import tasks
-import requests
 
-import datetime
-import random
-import sqlite3
+import asyncio
+import functools
+import math
 from dataclasses import dataclass
-from typing import Optional
-
-from ..tracker import Tracker, Player
-from ..bot import Bot, BotPlugin, BotError, get_member, handle_exception, try_get_member
-
-
-def get_all_mythic_plus_best_runs(region: str, realm: str, name: str) -> dict:
+from operator import itemgetter
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from ..api import RateLimiter, get_json
+from ..cache import TTLCache
+from ..database import Database
+from ..tracker import Tracker, Player, SpectatorChannel
+from ..bot import Bot, BotPlugin, BotError, get_member, handle_exception, leaderboard_footer, try_get_member
+
+# Realms like "Area 52" or "Aggra (Português)" have to be escaped
+PROFILE_URL = (
+    "https://raider.io/api/v1/characters/profile"
+    "?region={}"
+    "&realm={}"
+    "&name={}"
+    "&fields=mythic_plus_best_runs:all,mythic_plus_alternate_runs:all,mythic_plus_recent_runs"
+)
+
+# Ratings are displayed to one decimal, so smaller changes are noise
+RATING_THRESHOLD = 0.05
+
+# Pulls the score out of each run without a Python-level lambda
+SCORE = itemgetter("score")
+
+RECENT_RUN = "Their most recent run was {dungeon} +{level} in {time} with affixes {affixes}."
+
+
+async def get_all_mythic_plus_best_runs(
+    session: aiohttp.ClientSession,
+    region: str,
+    realm: str,
+    name: str,
+    limiter: Optional[RateLimiter] = None,
+) -> dict:
     """Query the given player for their best runs.
 
     Retrieves both outright best and alternate best runs. This can be
@@ -21,32 +49,24 @@ def get_all_mythic_plus_best_runs(region: str, realm: str, name: str) -> dict:
     class, spec, etc.
     """
 
-    url = (
-        f"https://raider.io/api/v1/characters/profile"
-        f"?region={region}"
-        f"&realm={realm}"
-        f"&name={name}"
-        f"&fields=mythic_plus_best_runs:all,mythic_plus_alternate_runs:all,mythic_plus_recent_runs"
-    )
-
-    response = requests.get(url, headers={"Accept": "application/json"})
+    url = PROFILE_URL.format(quote(region, safe=""), quote(realm, safe=""), quote(name, safe=""))
+    status, data = await get_json(session, url, limiter=limiter)
 
     # An error code likely means a provided parameter is incorrect
-    if response.status_code != 200:
-        raise BotError(f"received {response.status_code} error from raider.io!")
+    if status != 200:
+        raise BotError(f"received {status} error from raider.io!")
 
-    return response.json()
+    return data
 
 
 def compute_mythic_plus_rating(data: dict) -> float:
     """Compute the raider.io rating given best run data."""
 
-    score = 0
-    for run in data["mythic_plus_best_runs"]:
-        score += 1.5 * run["score"]
-    for run in data["mythic_plus_alternate_runs"]:
-        score += 0.5 * run["score"]
-    return score
+    # fsum is correctly rounded, so the total doesn't depend on the
+    # order raider.io happens to list the runs in
+    best = math.fsum(map(SCORE, data["mythic_plus_best_runs"]))
+    alternate = math.fsum(map(SCORE, data["mythic_plus_alternate_runs"]))
+    return 1.5 * best + 0.5 * alternate
 
 
 def describe_recent_runs(data: dict) -> Optional[str]:
@@ -55,19 +75,17 @@ def describe_recent_runs(data: dict) -> Optional[str]:
     recent_runs = data.get("mythic_plus_recent_runs")
     if recent_runs:
         run = recent_runs[0]
-        dungeon = run["dungeon"]
-        mythic_level = run["mythic_level"]
-        clear_time = _format_time(run["clear_time_ms"])
-        affixes = ", ".join(affix["name"] for affix in run["affixes"])
-        return (
-            f"Their most recent run was {dungeon} +{mythic_level} in {clear_time}"
-            f" with affixes {affixes}."
+        return RECENT_RUN.format(
+            dungeon=run["dungeon"],
+            level=run["mythic_level"],
+            time=_format_time(run["clear_time_ms"]),
+            affixes=", ".join(affix["name"] for affix in run["affixes"]),
         )
     else:
         return None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RaiderPlayer(Player):
     """This is a convenience class that mirrors the database record.
 
@@ -89,28 +107,41 @@ class RaiderPlayer(Player):
             "rating FLOAT",
             "UNIQUE (region, realm, name)",
         )
+        indexes = ("rating DESC",)
 
 
 class RaiderTracker(Tracker[RaiderPlayer]):
     """High level database access for raider.io commands.
 
     Abstracts away all the SQL queries we need to persist the state of
-    our notification bot. Requires a sqlite3 connection; it's not our
+    our notification bot. Requires a `Database`; it's not our
     responsibility to create the database file, only to use it.
     """
 
     class Meta:
         model = RaiderPlayer
 
+    @functools.cached_property
+    def _update_rating(self) -> str:
+        return f"UPDATE {self._players} SET rating=? WHERE id=?"
+
     def set_rating(self, player_id: int, rating: float):
         """Update a player's rating."""
 
-        with self.connection:
-            cursor = self.connection.cursor()
-            cursor.execute(
-                f"UPDATE {self._players} SET rating=? WHERE id=?",
-                (rating, player_id),
-            )
+        with self.transaction() as cursor:
+            cursor.execute(self._update_rating, (rating, player_id))
+
+    def set_ratings(self, ratings: List[Tuple[float, int]], prune: bool = False):
+        """Update many players' ratings in a single transaction.
+
+        If `prune` is set, players without spectators are deleted in
+        the same transaction.
+        """
+
+        with self.transaction() as cursor:
+            cursor.executemany(self._update_rating, ratings)
+            if prune:
+                cursor.execute(self._delete_players_without_spectator)
 
 
 def _format_time(ms: int) -> str:
@@ -122,15 +153,17 @@ def _format_time(ms: int) -> str:
     return f"{int(h):02}:{int(m):02}:{round(s):02}" if h > 0 else f"{int(m):02}:{round(s):02}"
 
 
-def create_rating_embed(data: dict, rating: float) -> disnake.Embed:
+def create_rating_embed(data: dict, rating: float, description: Optional[str] = None) -> disnake.Embed:
     """Used when rating command invoked."""
 
     name = data["name"]
+    if description is None:
+        description = describe_recent_runs(data)
 
     embed = disnake.Embed(
         title=f"{name} has mythic+ rating {round(rating, 1)}",
-        description=describe_recent_runs(data),
-        timestamp=datetime.datetime.now(),
+        description=description,
+        timestamp=disnake.utils.utcnow(),
     )
 
     character = " ".join((data["gender"], data["class"], data["race"])).lower().capitalize()
@@ -146,12 +179,20 @@ class RaiderPlugin(BotPlugin):
     """Provide subcommands related to raider.io API."""
 
     tracker: RaiderTracker
+    session: Optional[aiohttp.ClientSession]
+    semaphore: asyncio.Semaphore
+    cache: TTLCache[Tuple[str, str, str], dict]
+    limiter: RateLimiter
 
-    def __init__(self, bot: Bot, connection: sqlite3.Connection):
+    def __init__(self, bot: Bot, database: Database):
         """Set command handlers."""
 
         super().__init__(bot)
-        self.tracker = RaiderTracker(connection, prefix="raider")
+        self.tracker = RaiderTracker(database, prefix="raider")
+        self.session = None
+        self.semaphore = asyncio.Semaphore(8)
+        self.cache = TTLCache(ttl=240, maxsize=4096)
+        self.limiter = RateLimiter(5)
         self.commands = {
             "r": self.command_rating,
             "rating": self.command_rating,
@@ -163,64 +204,133 @@ class RaiderPlugin(BotPlugin):
         }
 
     async def on_ready(self):
-        """Start background tasks."""
+        """Open the HTTP session and start background tasks."""
+
+        # Reuse one pooled session so keep-alive connections to
+        # raider.io survive between requests.
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers={"Accept": "application/json"},
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    limit_per_host=16,
+                    keepalive_timeout=75,
+                    ttl_dns_cache=300,
+                ),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
 
         if not self.update.is_running():
             self.update.start()
 
+    async def close(self):
+        """Release pooled HTTP connections."""
+
+        if self.session is not None:
+            await self.session.close()
+
+    async def get_profile(self, region: str, realm: str, name: str) -> dict:
+        """Cached `get_all_mythic_plus_best_runs`, case-insensitive like raider.io."""
+
+        return await self.cache.get(
+            (region.lower(), realm.lower(), name.lower()),
+            lambda: get_all_mythic_plus_best_runs(self.session, region, realm, name, self.limiter),
+        )
+
     @tasks.loop(minutes=15)
     @handle_exception
     async def update(self):
         """Update all players, notify if new rating."""
 
-        for player in self.tracker.get_spectated_players():
+        # Fetch every player concurrently; one failure shouldn't stop
+        # the rest of the players from being updated. Their channels
+        # come back in the same query so notifying needs no more.
+        spectated = await asyncio.to_thread(self.tracker.get_spectated_players_with_channels)
+        players = list(spectated)
+        results = await asyncio.gather(*map(self.fetch_one, players), return_exceptions=True)
+
+        changed = []
+        for player, result in zip(players, results):
+            if isinstance(result, Exception):
+                await self.on_exception(result)
+            elif result is not None and abs(result[0] - player.rating) >= RATING_THRESHOLD:
+                changed.append((player, *result))
+
+        # Write every new rating in one transaction, then notify. Once
+        # an hour that transaction also clears out unspectated players.
+        prune = self.update.current_loop % 4 == 0
+        if changed or prune:
+            ratings = [(new_rating, player.id) for player, new_rating, _ in changed]
+            await asyncio.to_thread(self.tracker.set_ratings, ratings, prune)
+        for player, new_rating, data in changed:
+            await self.notify_player(player, new_rating, data, spectated[player])
+
+    async def fetch_one(self, player: RaiderPlayer) -> Optional[Tuple[float, dict]]:
+        """Fetch a single player's rating, bounded by the plugin semaphore."""
+
+        async with self.semaphore:
             try:
-                data = get_all_mythic_plus_best_runs(player.region, player.realm, player.name)
-                new_rating = compute_mythic_plus_rating(data)
+                data = await self.get_profile(player.region, player.realm, player.name)
             except BotError as error:
                 print(f"error while retrieving data for {player}: {error}")
-                continue
-
-            await self.update_player(player, new_rating, data)
-
-    @tasks.loop(hours=24)
-    @handle_exception
-    async def cleanup(self):
-        """Remove players that aren't spectated."""
-
-        self.tracker.delete_players_without_spectator()
-
-    async def update_player(self, player: RaiderPlayer, new_rating: float, data: dict):
-        """Update a player's rating and print their"""
-
-        if new_rating != player.rating:
-            self.tracker.set_rating(player.id, new_rating)
-
-            for item in self.tracker.get_spectator_channels(player.id):
-                channel = self.bot.get_channel(item.channel_id)
-                if channel is None:
-                    print(f"invalid channel for guild {item.guild_id}: {item.channel_id}")
-                    continue
-
-                member_name = ""
-                if item.user_id is not None:
-                    member = channel.guild.get_member(item.user_id)
-                    if member is not None:
-                        member_name = f" ({member.name})"
-
-                embed = disnake.Embed(
-                    title=f"{player.name} reached mythic+ rating {round(new_rating, 1)}",
-                    description=describe_recent_runs(data),
-                    color=0x77dd77,
-                    timestamp=datetime.datetime.now(),
-                )
+                return None
+
+        return compute_mythic_plus_rating(data), data
+
+    async def update_player(
+        self,
+        player: RaiderPlayer,
+        new_rating: float,
+        data: dict,
+        description: Optional[str] = None,
+    ):
+        """Update a player's rating and notify spectators."""
+
+        if abs(new_rating - player.rating) >= RATING_THRESHOLD:
+            await asyncio.to_thread(self.tracker.set_rating, player.id, new_rating)
+            await self.notify_player(player, new_rating, data, description=description)
+
+    async def notify_player(
+        self,
+        player: RaiderPlayer,
+        new_rating: float,
+        data: dict,
+        items: Optional[List[SpectatorChannel]] = None,
+        description: Optional[str] = None,
+    ):
+        """Post a rating change to every spectating channel.
+
+        Pass `description` if the recent run was already described for
+        this `data`, e.g. by the rating command.
+        """
+
+        if items is None:
+            items = await asyncio.to_thread(list, self.tracker.get_spectator_channels(player.id))
+
+        channels = []
+        for item in items:
+            channel = await self.bot.resolve_channel(item.channel_id)
+            if channel is None:
+                print(f"invalid channel for guild {item.guild_id}: {item.channel_id}")
+            else:
+                channels.append(channel)
+
+        # Every channel gets the same embed, so build it once
+        if description is None:
+            description = describe_recent_runs(data)
+        embed = disnake.Embed(
+            title=f"{player.name} reached mythic+ rating {round(new_rating, 1)}",
+            description=description,
+            color=0x77dd77,
+            timestamp=disnake.utils.utcnow(),
+        )
 
-                embed.add_field(name="Previous", value=str(round(player.rating, 1)), inline=True)
-                embed.add_field(name="Gain", value=str(round(new_rating - player.rating, 1)), inline=True)
-                embed.add_field("Raider", data["profile_url"], inline=False)
-                embed.set_thumbnail(url=data["thumbnail_url"])
+        embed.add_field(name="Previous", value=str(round(player.rating, 1)), inline=True)
+        embed.add_field(name="Gain", value=str(round(new_rating - player.rating, 1)), inline=True)
+        embed.add_field("Raider", data["profile_url"], inline=False)
+        embed.set_thumbnail(url=data["thumbnail_url"])
 
-                await channel.send(embed=embed)
+        await self.broadcast(channels, embed=embed)
 
     async def command_rating(self, text: str, message: disnake.Message):
         """Respond to rating request."""
@@ -229,21 +339,21 @@ class RaiderPlugin(BotPlugin):
 
         # Try accessing existing player by name or Discord ID
         if len(parts) == 1:
-            player = self.tracker.get_player(name=parts[0])
+            player = await asyncio.to_thread(self.tracker.get_player, name=parts[0])
             if player is None:
                 member = try_get_member(parts[0], message)
                 if member is not None:
-                    player = self.tracker.get_player_with_user_id(message.guild.id, member.id)
+                    player = await asyncio.to_thread(self.tracker.get_player_with_user_id, message.guild.id, member.id)
 
             if player is None:
                 raise BotError("Error: failed to find matching player!")
 
         # Go through raider.io identifier
         elif len(parts) == 3:
-            player = self.tracker.get_player(region=parts[0], realm=parts[1], name=parts[1])
+            player = await asyncio.to_thread(self.tracker.get_player, region=parts[0], realm=parts[1], name=parts[1])
 
             if player is None:
-                data = get_all_mythic_plus_best_runs(parts[0], parts[1], parts[2])
+                data = await self.get_profile(parts[0], parts[1], parts[2])
                 rating = compute_mythic_plus_rating(data)
                 await message.channel.send(embed=create_rating_embed(data, rating))
                 return
@@ -251,11 +361,13 @@ class RaiderPlugin(BotPlugin):
         else:
             raise BotError("expected either a server member or region, realm, and name!")
 
-        data = get_all_mythic_plus_best_runs(player.region, player.realm, player.name)
+        data = await self.get_profile(player.region, player.realm, player.name)
         rating = compute_mythic_plus_rating(data)
 
-        await message.channel.send(embed=create_rating_embed(data, rating))
-        await self.update_player(player, rating, data)
+        # The reply and any notification describe the same recent run
+        description = describe_recent_runs(data)
+        await message.channel.send(embed=create_rating_embed(data, rating, description))
+        await self.update_player(player, rating, data, description)
 
     async def command_add(self, text: str, message: disnake.Message):
         """Start spectating a user."""
@@ -270,20 +382,21 @@ class RaiderPlugin(BotPlugin):
         else:
             raise BotError("expected `region`, `realm`, `name`, and optional `server member`!")
 
-        self.tracker.set_channel_if_unset(message.guild.id, message.channel.id)
+        await asyncio.to_thread(self.tracker.set_channel_if_unset, message.guild.id, message.channel.id)
 
-        player = self.tracker.get_player(region=region, realm=realm, name=name)
+        player = await asyncio.to_thread(self.tracker.get_player, region=region, realm=realm, name=name)
         if player is None:
-            data = get_all_mythic_plus_best_runs(region, realm, name)
+            data = await self.get_profile(region, realm, name)
             rating = compute_mythic_plus_rating(data)
-            player = self.tracker.create_player(
+            player = await asyncio.to_thread(
+                self.tracker.create_player,
                 region=data["region"],
                 realm=data["realm"],
                 name=data["name"],
                 rating=rating,
             )
 
-        created = self.tracker.create_spectator(message.guild.id, player.id, user_id)
+        created = await asyncio.to_thread(self.tracker.create_spectator, message.guild.id, player, user_id)
         action = "Started watching" if created else "Already watching"
         await message.channel.send(f"{action} {player.name} ({round(player.rating, 1)} rating)")
 
@@ -294,19 +407,21 @@ class RaiderPlugin(BotPlugin):
         if len(parts) != 3:
             raise BotError("expected `region`, `realm`, and `name`!")
 
-        player = self.tracker.get_player(region=parts[0], realm=parts[1], name=parts[2])
+        player = await asyncio.to_thread(self.tracker.get_player, region=parts[0], realm=parts[1], name=parts[2])
         if player is None:
             raise BotError(f"couldn't find player {parts[2]}!")
 
-        deleted = self.tracker.delete_spectator(message.guild.id, player.id)
+        deleted = await asyncio.to_thread(self.tracker.delete_spectator, message.guild.id, player.id)
         action = "Stopped watching" if deleted else "Wasn't watching"
         await message.channel.send(f"{action} {player.name}")
 
     async def command_leaderboard(self, text: str, message: disnake.Message):
         """List players watched by the guild in order of rating."""
 
-        players = list(self.tracker.get_players_spectated_by_guild(message.guild.id))
-        players.sort(key=lambda item: item.player.rating, reverse=True)
+        players = await asyncio.to_thread(
+            list,
+            self.tracker.get_players_spectated_by_guild(message.guild.id, order_by="rating DESC"),
+        )
 
         lines = []
         for i, item in enumerate(players, start=1):
@@ -321,29 +436,18 @@ class RaiderPlugin(BotPlugin):
             title="Mythic+ Leaderboard",
             description="\n".join(lines) or "It's a little bit empty in here...",
             color=0xF0C43F,
-            timestamp=datetime.datetime.now(),
+            timestamp=disnake.utils.utcnow(),
         )
 
         # Allow the footer to be empty, in which case we don't set it
         if players:
             first = players[0].player
-            embed.set_footer(text=random.choice(
-                (
-                    f"{first.name} needs to go outside",
-                    f"{first.name} should probably touch grass",
-                    f"{first.name} might need to take a break",
-                    f"{first.name} hasn't showered in days",
-                    f"{first.name} is losing their grip",
-                    f"{first.name} definitely isn't short",
-                    f"Somebody should check on {first.name}",
-                    f"I can smell {first.name} from here",
-                )
-            ))
+            embed.set_footer(text=leaderboard_footer(first.name))
 
         await message.channel.send(embed=embed)
 
     async def command_here(self, text: str, message: disnake.Message):
         """Set the notification channel for this plugin."""
 
-        self.tracker.set_channel(message.guild.id, message.channel.id)
+        await asyncio.to_thread(self.tracker.set_channel, message.guild.id, message.channel.id)
         await message.channel.send("Raider notifications will be posted to this channel!")
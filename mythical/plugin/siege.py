@@ -1,19 +1,19 @@
-import configparser
+import functools
 import ipaddress
-import sqlite3
 import sys
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 import disnake
 import siegeapi
 from disnake.ext import tasks
 
-from ..tracker import Player, Tracker
-from ..bot import Bot, BotPlugin, BotError, handle_exception, get_member
+from ..database import Database
+from ..tracker import Player, SpectatorChannel, Tracker
+from ..bot import GAIN, LOSS, Bot, BotPlugin, BotError, handle_exception, get_member
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SiegePlayer(Player):
     """This is a convenience class that mirrors the database record.
 
@@ -47,13 +47,40 @@ class SiegeTracker(Tracker[SiegePlayer]):
     """High level database access for raider.io commands.
 
     Abstracts away all the SQL queries we need to persist the state of
-    our notification bot. Requires a sqlite3 connection; it's not our
+    our notification bot. Requires a `Database`; it's not our
     responsibility to create the database file, only to use it.
     """
 
     class Meta:
         model = SiegePlayer
 
+    @functools.cached_property
+    def _update_rank(self) -> str:
+        return f"""
+            UPDATE {self._players}
+            SET (name, rank_name, rank_points, season_kills, season_deaths)=(?, ?, ?, ?, ?)
+            WHERE id=?
+            """
+
+    def set_ranks(self, ranks: List[Tuple[str, str, int, int, int, int]]):
+        """Update many players' ranks in a single transaction."""
+
+        with self.transaction() as cursor:
+            cursor.executemany(self._update_rank, ranks)
+
+
+def rank_row(player: SiegePlayer, player_data: siegeapi.Player) -> Tuple[str, str, int, int, int, int]:
+    """Parameters for `SiegeTracker.set_ranks` from fresh player data."""
+
+    return (
+        player_data.name,
+        player_data.ranked_profile.rank,
+        player_data.ranked_profile.rank_points,
+        player_data.ranked_profile.kills,
+        player_data.ranked_profile.deaths,
+        player.id,
+    )
+
 
 class SiegePlugin(BotPlugin):
     """Provide subcommands related to the Siege API."""
@@ -61,11 +88,11 @@ class SiegePlugin(BotPlugin):
     tracker: SiegeTracker
     token: str
 
-    def __init__(self, bot: Bot, connection: sqlite3.Connection):
+    def __init__(self, bot: Bot, database: Database):
         """Set command handlers."""
 
         super().__init__(bot)
-        self.tracker = SiegeTracker(connection, prefix="siege")
+        self.tracker = SiegeTracker(database, prefix="siege")
         self.commands = {
             "r": self.command_rating,
             "rating": self.command_rating,
@@ -77,7 +104,7 @@ class SiegePlugin(BotPlugin):
             "here": self.command_here,
         }
 
-    def configure(self, section: Optional[configparser.SectionProxy]) -> None:
+    def configure(self, section: Optional[Dict[str, str]]) -> None:
         """Configure the plugin based on `mythical.conf`."""
 
         self.token = siegeapi.Auth.get_basic_token(section["email"], section["password"])
@@ -93,81 +120,110 @@ class SiegePlugin(BotPlugin):
     async def update(self):
         """Update all players, notify if new rating."""
 
+        # Channels come back with the players so notifying every change
+        # needs no further queries
+        spectated = self.tracker.get_spectated_players_with_channels()
+        changed = []
         auth = siegeapi.Auth(token=self.token)
         try:
-            for player in self.tracker.get_spectated_players():
-                player_data = await auth.get_player(uid=player.uid)
-                await player_data.load_ranked_v2()
-                await self.update_player(player, player_data)
-        except ipaddress.AddressValueError as error:
-            raise BotError(f"invalid request: {error}")
-        except RecursionError as error:
-            print(f"recursion error: {error}")
+            for player in spectated:
+                player_data = await self.fetch_one(auth, player)
+                if player_data is not None and player_data.ranked_profile.rank_points != player.rank_points:
+                    changed.append((player, player_data))
         finally:
             await auth.close()
 
+        # Write every new rank in one transaction, then notify
+        if changed:
+            self.tracker.set_ranks([rank_row(player, player_data) for player, player_data in changed])
+        for player, player_data in changed:
+            await self.notify_player(player, player_data, spectated[player])
+
+    async def fetch_one(self, auth: siegeapi.Auth, player: SiegePlayer) -> Optional[siegeapi.Player]:
+        """Fetch a single player's ranked profile.
+
+        Failures are reported and skipped; one broken account shouldn't
+        stop the rest of the players from being updated.
+        """
+
+        try:
+            player_data = await auth.get_player(uid=player.uid)
+            await player_data.load_ranked_v2()
+        except ipaddress.AddressValueError as error:
+            await self.on_exception(BotError(f"invalid request for {player.name}: {error}"))
+            return None
+        except RecursionError as error:
+            print(f"recursion error for {player.name}: {error}")
+            return None
+        except Exception as error:
+            await self.on_exception(error)
+            return None
+
+        return player_data
+
     async def update_player(self, player: SiegePlayer, player_data: siegeapi.Player):
         """Update a player's level and elo and notify."""
 
-        new_name = player_data.name
+        if player.rank_points != player_data.ranked_profile.rank_points:
+            self.tracker.set_ranks([rank_row(player, player_data)])
+            await self.notify_player(player, player_data)
+
+    async def notify_player(
+        self,
+        player: SiegePlayer,
+        player_data: siegeapi.Player,
+        items: Optional[List[SpectatorChannel]] = None,
+    ):
+        """Post a rank change to every spectating channel."""
+
         new_rank_name = player_data.ranked_profile.rank
         new_rank_points = player_data.ranked_profile.rank_points
         new_season_kills = player_data.ranked_profile.kills
         new_season_deaths = player_data.ranked_profile.deaths
 
-        if player.rank_points != new_rank_points:
-            self.tracker.update_player(
-                player.id,
-                name=new_name,
-                rank_name=new_rank_name,
-                rank_points=new_rank_points,
-                season_kills=new_season_kills,
-                season_deaths=new_season_deaths,
-            )
-
-            for item in self.tracker.get_spectator_channels(player.id):
-                channel = self.bot.get_channel(item.channel_id)
-                if channel is None:
-                    print(f"invalid channel for guild {item.guild_id}: {item.channel_id}", file=sys.stderr)
-                    continue
-
-                if item.user_id is not None:
-                    member = channel.guild.get_member(item.user_id)
-                    if member is not None:
-                        member_name = f" ({member.name})"
-
-                description = []
-
-                sign = "+" if new_rank_points >= player.rank_points else "-"
-                description.append(
-                    f"Their current ELO is **{str(round(new_rank_points))}**"
-                    f" ({sign}{round(abs(new_rank_points - player.rank_points))})."
-                )
+        if items is None:
+            items = list(self.tracker.get_spectator_channels(player.id))
 
-                kills = new_season_kills - player.season_kills
-                deaths = new_season_deaths - player.season_deaths
-                if kills >= 0 and deaths >= 0:
-                    description.append(f"In their last game(s) they went {kills}/{deaths}.")
+        channels = []
+        for item in items:
+            channel = await self.bot.resolve_channel(item.channel_id)
+            if channel is None:
+                print(f"invalid channel for guild {item.guild_id}: {item.channel_id}", file=sys.stderr)
+            else:
+                channels.append(channel)
 
-                description.append(f"They are {new_rank_name}.")
+        # Every channel gets the same embed, so build it once
+        description = []
 
-                reached = (
-                    f"gained {new_rank_points - player.rank_points}"
-                    if new_rank_points >= player.rank_points else
-                    f"lost {player.rank_points - new_rank_points}"
-                )
-                embed = disnake.Embed(
-                    title=f"{player.name} {reached} elo",
-                    description=" ".join(description),
-                    color=(
-                        disnake.Colour.brand_green()
-                        if new_rank_points >= player.rank_points
-                        else disnake.Colour.brand_red()
-                    ),
-                )
+        sign = "+" if new_rank_points >= player.rank_points else "-"
+        description.append(
+            f"Their current ELO is **{str(round(new_rank_points))}**"
+            f" ({sign}{round(abs(new_rank_points - player.rank_points))})."
+        )
+
+        kills = new_season_kills - player.season_kills
+        deaths = new_season_deaths - player.season_deaths
+        if kills >= 0 and deaths >= 0:
+            description.append(f"In their last game(s) they went {kills}/{deaths}.")
+
+        description.append(f"They are {new_rank_name}.")
+
+        reached = (
+            f"gained {new_rank_points - player.rank_points}"
+            if new_rank_points >= player.rank_points else
+            f"lost {player.rank_points - new_rank_points}"
+        )
+        embed = disnake.Embed(
+            title=f"{player.name} {reached} elo",
+            description=" ".join(description),
+            color=GAIN if new_rank_points >= player.rank_points else LOSS,
+        )
+
+        embed.set_thumbnail(player_data.profile_pic_url)
 
-                embed.set_thumbnail(player_data.profile_pic_url)
-                await channel.send(embed=embed)
+        # A failed send is logged without stopping the other channels,
+        # so one bad channel can't swallow the rest of the announcements
+        await self.broadcast(channels, embed=embed)
 
     async def command_rating(self, text: str, message: disnake.Message):
         """Respond to rating request."""
@@ -239,7 +295,7 @@ class SiegePlugin(BotPlugin):
             finally:
                 await auth.close()
 
-        created = self.tracker.create_spectator(message.guild.id, player.id, user_id)
+        created = self.tracker.create_spectator(message.guild.id, player, user_id)
         action = "Started watching" if created else "Already watching"
         await message.channel.send(f"{action} {player.name} ({player.rank_name}, {player.rank_points} elo)")
 
@@ -1,59 +1,59 @@
 import sys
 
+import aiohttp
 import disnake
 from disnake.ext import tasks
-import requests
 
-import random
-import datetime
-import sqlite3
+import asyncio
+import functools
 from dataclasses import dataclass
-from typing import Tuple
+from typing import Optional, Tuple
 
+from ..api import get_json
+from ..database import Database
 from ..tracker import Tracker, Player
-from ..bot import Bot, BotPlugin, BotError, get_member, handle_exception, try_get_member
+from ..bot import GAIN, LOSS, Bot, BotPlugin, BotError, get_member, handle_exception, leaderboard_footer, try_get_member
 
+API = "https://api.henrikdev.xyz/valorant"
 
-def get_valorant_account(name: str, tag: str) -> dict:
+
+async def get_valorant_account(session: aiohttp.ClientSession, name: str, tag: str) -> dict:
     """Get by name and tag; has region and puid."""
 
-    response = requests.get(f"https://api.henrikdev.xyz/valorant/v1/account/{name}/{tag}")
-    if response.status_code != 200:
+    status, data = await get_json(session, f"{API}/v1/account/{name}/{tag}")
+    if status != 200:
         raise BotError(f"couldn't find player {name}#{tag}")
-    return response.json()
+    return data
 
 
-def get_valorant_rank(region: str, nickname: str, tag: str) -> dict:
+async def get_valorant_rank(session: aiohttp.ClientSession, region: str, nickname: str, tag: str) -> dict:
     """Access free API."""
 
-    response = requests.get(f"https://api.henrikdev.xyz/valorant/v1/mmr/{region}/{nickname}/{tag}")
-    if response.status_code != 200:
+    status, data = await get_json(session, f"{API}/v1/mmr/{region}/{nickname}/{tag}")
+    if status != 200:
         raise BotError(f"couldn't find player {nickname}#{tag}!")
-    return response.json()
+    return data
 
 
-def get_valorant_rank_by_riot_id(region: str, riot_id: str) -> dict:
+async def get_valorant_rank_by_riot_id(session: aiohttp.ClientSession, region: str, riot_id: str) -> dict:
     """Access free API."""
 
-    response = requests.get(f"https://api.henrikdev.xyz/valorant/v1/by-puuid/mmr/{region}/{riot_id}")
-    if response.status_code != 200:
+    status, data = await get_json(session, f"{API}/v1/by-puuid/mmr/{region}/{riot_id}")
+    if status != 200:
         raise BotError(f"couldn't find player {riot_id}!")
-    return response.json()
+    return data
 
 
-def get_valorant_match_history(region: str, riot_id: str) -> dict:
+async def get_valorant_match_history(session: aiohttp.ClientSession, region: str, riot_id: str) -> dict:
     """Get last 5 matches."""
 
-    response = requests.get(
-        f"https://api.henrikdev.xyz/valorant/v3/by-puuid/matches/{region}/{riot_id}?filter=competitive"
-    )
-
-    if response.status_code != 200:
+    status, data = await get_json(session, f"{API}/v3/by-puuid/matches/{region}/{riot_id}?filter=competitive")
+    if status != 200:
         raise BotError(f"couldn't find player {riot_id}!")
-    return response.json()
+    return data
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ValorantPlayer(Player):
     """This is a convenience class that mirrors the database record.
 
@@ -85,28 +85,29 @@ class ValorantPlayer(Player):
             "rr_mod INTEGER NOT NULL",
             "UNIQUE (riot_id)",
         )
+        indexes = ("rr DESC",)
 
 
 class ValorantTracker(Tracker[ValorantPlayer]):
     """High level database access for raider.io commands.
 
     Abstracts away all the SQL queries we need to persist the state of
-    our notification bot. Requires a sqlite3 connection; it's not our
+    our notification bot. Requires a `Database`; it's not our
     responsibility to create the database file, only to use it.
     """
 
     class Meta:
         model = ValorantPlayer
 
+    @functools.cached_property
+    def _update_level(self) -> str:
+        return f"UPDATE {self._players} SET (rank, rr, rr_mod)=(?, ?, ?) WHERE id=?"
+
     def set_level(self, player_id: int, rank: str, rr: int, rr_mod: int):
         """Update a player's rating."""
 
-        with self.connection:
-            cursor = self.connection.cursor()
-            cursor.execute(
-                f"UPDATE {self._players} SET (rank, rr, rr_mod)=(?, ?, ?) WHERE id=?",
-                (rank, rr, rr_mod, player_id),
-            )
+        with self.transaction() as cursor:
+            cursor.execute(self._update_level, (rank, rr, rr_mod, player_id))
 
 
 def parse_username(text: str) -> Tuple[str, str]:
@@ -122,12 +123,14 @@ class ValorantPlugin(BotPlugin):
     """Provide subcommands related to Faceit API."""
 
     tracker: ValorantTracker
+    session: Optional[aiohttp.ClientSession]
 
-    def __init__(self, bot: Bot, connection: sqlite3.Connection):
+    def __init__(self, bot: Bot, database: Database):
         """Set command handlers."""
 
         super().__init__(bot)
-        self.tracker = ValorantTracker(connection, prefix="valorant")
+        self.tracker = ValorantTracker(database, prefix="valorant")
+        self.session = None
         self.commands = {
             "r": self.command_rating,
             "rr": self.command_rating,
@@ -141,18 +144,38 @@ class ValorantPlugin(BotPlugin):
         }
 
     async def on_ready(self):
-        """Start background tasks."""
+        """Open the HTTP session and start background tasks."""
+
+        # Reuse one pooled session so keep-alive connections to the API
+        # survive between requests.
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                headers={"Accept": "application/json"},
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    limit_per_host=16,
+                    keepalive_timeout=75,
+                    ttl_dns_cache=300,
+                ),
+                timeout=aiohttp.ClientTimeout(total=30),
+            )
 
         if not self.update.is_running():
             self.update.start()
 
+    async def close(self):
+        """Release pooled HTTP connections."""
+
+        if self.session is not None:
+            await self.session.close()
+
     @tasks.loop(minutes=15)
     @handle_exception
     async def update(self):
         """Update all players, notify if new rating."""
 
-        for player in self.tracker.get_spectated_players():
-            data = get_valorant_rank_by_riot_id(player.region, player.riot_id)
+        for player in await asyncio.to_thread(list, self.tracker.get_spectated_players()):
+            data = await get_valorant_rank_by_riot_id(self.session, player.region, player.riot_id)
             await self.update_player(player, data)
 
     @tasks.loop(hours=24)
@@ -160,7 +183,7 @@ class ValorantPlugin(BotPlugin):
     async def cleanup(self):
         """Remove players that aren't spectated."""
 
-        self.tracker.delete_players_without_spectator()
+        await asyncio.to_thread(self.tracker.delete_players_without_spectator)
 
     async def update_player(self, player: ValorantPlayer, data: dict):
         """Update a player's level and elo and notify."""
@@ -170,12 +193,12 @@ class ValorantPlugin(BotPlugin):
         new_rr_mod = data["data"]["ranking_in_tier"]
 
         if new_rr != player.rr:
-            self.tracker.set_level(player.id, new_rank, new_rr, new_rr_mod)
+            await asyncio.to_thread(self.tracker.set_level, player.id, new_rank, new_rr, new_rr_mod)
 
-            account_data = get_valorant_account(data["data"]["name"], data["data"]["tag"])
+            account_data = await get_valorant_account(self.session, data["data"]["name"], data["data"]["tag"])
 
             description = []
-            last_matches = get_valorant_match_history(player.region, player.riot_id)
+            last_matches = await get_valorant_match_history(self.session, player.region, player.riot_id)
             last_match = last_matches["data"][0]
             map_name = last_match["metadata"]["map"]
             kills = 0
@@ -217,7 +240,7 @@ class ValorantPlugin(BotPlugin):
                 f"lost {player.rr - new_rr}"
             )
 
-            for item in self.tracker.get_spectator_channels(player.id):
+            for item in await asyncio.to_thread(list, self.tracker.get_spectator_channels(player.id)):
                 channel = self.bot.get_channel(item.channel_id)
                 if channel is None:
                     print(f"invalid channel for guild {item.guild_id}: {item.channel_id}", file=sys.stderr)
@@ -232,8 +255,8 @@ class ValorantPlugin(BotPlugin):
                 embed = disnake.Embed(
                     title=f"{player.username} {reached} rr",
                     description=" ".join(description),
-                    color=disnake.Colour.brand_green() if new_rr > player.rr else disnake.Colour.brand_red(),
-                    timestamp=datetime.datetime.now(),
+                    color=GAIN if new_rr > player.rr else LOSS,
+                    timestamp=disnake.utils.utcnow(),
                 )
 
                 embed.add_field(name="Previous", value=str(round(player.rr, 1)), inline=True)
@@ -252,22 +275,22 @@ class ValorantPlugin(BotPlugin):
         if len(parts) == 1:
             member = try_get_member(parts[0], message)
             if member is not None:
-                player = self.tracker.get_player_with_user_id(message.guild.id, member.id)
+                player = await asyncio.to_thread(self.tracker.get_player_with_user_id, message.guild.id, member.id)
                 username = player.username
                 riot_id = player.riot_id
                 region = player.region
             else:
                 username = parts[0]
                 name, tag = parse_username(username)
-                account_data = get_valorant_account(name, tag)
+                account_data = await get_valorant_account(self.session, name, tag)
                 riot_id = account_data["data"]["puuid"]
                 region = account_data["data"]["region"]
-            data = get_valorant_rank_by_riot_id(region, riot_id)
+            data = await get_valorant_rank_by_riot_id(self.session, region, riot_id)
 
         elif len(parts) == 2:
             region, username = parts
             name, tag = parse_username(username)
-            data = get_valorant_rank(region, name, tag)
+            data = await get_valorant_rank(self.session, region, name, tag)
 
         else:
             raise BotError("expected `username`, `server member`, or `region` and `username`")
@@ -295,20 +318,21 @@ class ValorantPlugin(BotPlugin):
         else:
             raise BotError("expected `region`, `username`, and optional `server member`!")
 
-        self.tracker.set_channel_if_unset(message.guild.id, message.channel.id)
+        await asyncio.to_thread(self.tracker.set_channel_if_unset, message.guild.id, message.channel.id)
 
         name, tag = parse_username(username)
-        account_data = get_valorant_account(name, tag)
+        account_data = await get_valorant_account(self.session, name, tag)
         region = account_data["data"]["region"]
         riot_id = account_data["data"]["puuid"]
 
-        player = self.tracker.get_player(riot_id=riot_id)
+        player = await asyncio.to_thread(self.tracker.get_player, riot_id=riot_id)
         if player is None:
-            data = get_valorant_rank(region, name, tag)
+            data = await get_valorant_rank(self.session, region, name, tag)
             rank = data["data"]["currenttierpatched"]
             rr = data["data"]["elo"]
             rr_mod = data["data"]["ranking_in_tier"]
-            player = self.tracker.create_player(
+            player = await asyncio.to_thread(
+                self.tracker.create_player,
                 region=region,
                 name=name,
                 tag=tag,
@@ -318,7 +342,7 @@ class ValorantPlugin(BotPlugin):
                 rr_mod=rr_mod
             )
 
-        created = self.tracker.create_spectator(message.guild.id, player.id, user_id)
+        created = await asyncio.to_thread(self.tracker.create_spectator, message.guild.id, player, user_id)
         action = "Started watching" if created else "Already watching"
         await message.channel.send(f"{action} {player.username} ({player.rank}, {player.rr_mod} rr)")
 
@@ -326,22 +350,24 @@ class ValorantPlugin(BotPlugin):
         """Stop spectating a user."""
 
         name, tag = parse_username(text)
-        account_data = get_valorant_account(name, tag)
+        account_data = await get_valorant_account(self.session, name, tag)
         riot_id = account_data["data"]["puuid"]
 
-        player = self.tracker.get_player(riot_id=riot_id)
+        player = await asyncio.to_thread(self.tracker.get_player, riot_id=riot_id)
         if player is None:
             raise BotError(f"couldn't find player {text}!")
 
-        deleted = self.tracker.delete_spectator(message.guild.id, player.id)
+        deleted = await asyncio.to_thread(self.tracker.delete_spectator, message.guild.id, player.id)
         action = "Stopped watching" if deleted else "Wasn't watching"
         await message.channel.send(f"{action} {player.name}")
 
     async def command_leaderboard(self, text: str, message: disnake.Message):
         """List players watched by the guild in order of rating."""
 
-        players = list(self.tracker.get_players_spectated_by_guild(message.guild.id))
-        players.sort(key=lambda item: item.player.rr, reverse=True)
+        players = await asyncio.to_thread(
+            list,
+            self.tracker.get_players_spectated_by_guild(message.guild.id, order_by="rr DESC"),
+        )
 
         lines = []
         for i, item in enumerate(players, start=1):
@@ -356,29 +382,18 @@ class ValorantPlugin(BotPlugin):
             title="Valorant Leaderboard",
             description="\n".join(lines) or "It's a little bit empty in here...",
             color=0xF0C43F,
-            timestamp=datetime.datetime.now(),
+            timestamp=disnake.utils.utcnow(),
         )
 
         # Allow the footer to be empty, in which case we don't set it
         if players:
             first = players[0].player
-            embed.set_footer(text=random.choice(
-                (
-                    f"{first.username} needs to go outside",
-                    f"{first.username} should probably touch grass",
-                    f"{first.username} might need to take a break",
-                    f"{first.username} hasn't showered in days",
-                    f"{first.username} is losing their grip",
-                    f"{first.username} definitely isn't short",
-                    f"Somebody should check on {first.username}",
-                    f"I can smell {first.username} from here",
-                )
-            ))
+            embed.set_footer(text=leaderboard_footer(first.username))
 
         await message.channel.send(embed=embed)
 
     async def command_here(self, text: str, message: disnake.Message):
         """Set the notification channel for this plugin."""
 
-        self.tracker.set_channel(message.guild.id, message.channel.id)
+        await asyncio.to_thread(self.tracker.set_channel, message.guild.id, message.channel.id)
         await message.channel.send("Valorant notifications will be posted to this channel!")
@@ -1,30 +1,41 @@
 import abc
+import contextlib
+import functools
 import sqlite3
 import dataclasses
-from typing import Generic, TypeVar, Iterator, Type, Tuple, Optional
+from typing import Dict, Generic, TypeVar, Iterator, List, Type, Tuple, Optional
 
+from .database import Database
 
-@dataclasses.dataclass
+
+@dataclasses.dataclass(slots=True, frozen=True)
 class Player:
-    """Base player object."""
+    """Base player object.
+
+    Rows are read far more often than they're changed, so players are
+    immutable and slotted; subclasses must be declared the same way.
+    Rows are passed positionally, so `Meta.fields` must list the
+    fields in the order they're declared.
+    """
 
     id: int
 
     class Meta:
         fields: Tuple[str, ...]
         schema: Tuple[str, ...]
+        indexes: Tuple[str, ...] = ()
 
 
 T = TypeVar("T", bound=Player)
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(slots=True, frozen=True)
 class SpectatedPlayer(Generic[T]):
     player: T
     user_id: int
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(slots=True, frozen=True)
 class SpectatorChannel:
     guild_id: int
     channel_id: int
@@ -37,27 +48,51 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
     class Meta:
         model: Type[T]
 
-    connection: sqlite3.Connection
+    database: Database
     prefix: str
 
     _players: str
     _spectators: str
     _channels: str
+    _select_player_queries: Dict[Tuple[str, ...], str]
 
-    def __init__(self, connection: sqlite3.Connection, prefix: str):
+    def __init__(self, database: Database, prefix: str):
         """Set the table prefix for this app."""
 
-        self.connection = connection
+        self.database = database
         self.prefix = prefix
         self._players = f"{self.prefix}_players"
         self._spectators = f"{self.prefix}_spectators"
         self._channels = f"{self.prefix}_channels"
+        self._select_player_queries = {}
 
         # Setup
         self.create_players_table()
         self.create_spectators_table()
         self.create_channels_table()
 
+    # The fixed queries below are formatted once per tracker and cached;
+    # besides skipping the string building on every call, identical
+    # text is what SQLite's statement cache keys on.
+
+    @functools.cached_property
+    def _columns(self) -> Tuple[str, ...]:
+        return ("id", *self.Meta.model.Meta.fields)
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """Use the writer connection and commit or roll back on exit."""
+
+        with self.database.write() as connection:
+            yield connection.cursor()
+
+    @contextlib.contextmanager
+    def query(self) -> Iterator[sqlite3.Cursor]:
+        """Check out a pooled reader for the duration of a query."""
+
+        with self.database.read() as connection:
+            yield connection.cursor()
+
     def create_players_table(self):
         """Maintained by each subclass."""
 
@@ -65,67 +100,79 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
         # server might be watching. The region, realm, and name must
         # be unique to guarantee there are no repeats. Note that these
         # fields are also case-insensitive (per the raider.io API).
-        self.connection.execute(
-            f"""
-            CREATE TABLE IF NOT EXISTS {self._players} (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                {", ".join(self.Meta.model.Meta.schema)}
+        with self.transaction() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._players} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    {", ".join(self.Meta.model.Meta.schema)}
+                )
+                """
             )
+
+            # Models may also index columns they sort or filter by, e.g.
+            # `indexes = ("rating DESC",)`
+            for index in getattr(self.Meta.model.Meta, "indexes", ()):
+                column = index.split()[0]
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {self._players}_{column} ON {self._players} ({index})"
+                )
+
+    @functools.cached_property
+    def _insert_player(self) -> str:
+        fields = self.Meta.model.Meta.fields
+        return f"""
+            INSERT OR IGNORE INTO {self._players} ({", ".join(fields)})
+            VALUES ({", ".join(("?",) * len(fields))})
             """
-        )
 
     def create_player(self, **kwargs) -> Optional[T]:
         """Create a player, returning the generated ID."""
 
-        with self.connection:
-            cursor = self.connection.cursor()
-
-            fields = self.Meta.model.Meta.fields
-            values = tuple(kwargs[field] for field in fields)
+        with self.transaction() as cursor:
+            values = tuple(kwargs[field] for field in self.Meta.model.Meta.fields)
 
             # Update rating if we're trying to add a duplicate record
-            cursor.execute(
-                f"""
-                INSERT OR IGNORE INTO {self._players} ({", ".join(fields)})
-                VALUES ({", ".join(("?",) * len(fields))})
-                """,
-                values,
-            )
+            cursor.execute(self._insert_player, values)
 
-            # Get the player ID that was just inserted
+            # The cursor already knows the ID that was just inserted
             if cursor.rowcount > 0:
-                cursor.execute("SELECT last_insert_rowid()")
-                return self.Meta.model(id=cursor.fetchone()[0], **kwargs)
+                return self.Meta.model(id=cursor.lastrowid, **kwargs)
             else:
                 return None
 
+    def _select_player(self, keys: Tuple[str, ...]) -> str:
+        # Only a handful of keyword combinations are ever used, so the
+        # cache stays small and each gets a single statement text
+        query = self._select_player_queries.get(keys)
+        if query is None:
+            query = self._select_player_queries[keys] = f"""
+                SELECT {", ".join(self._columns)}
+                FROM {self._players}
+                WHERE {" AND ".join(f"{key}=?" for key in keys)}
+                """
+        return query
+
     def get_player(self, **kwargs) -> Optional[T]:
         """Get the first player that matches the kwargs."""
 
-        # Just in case we don't have ordered dictionaries
-        keys, values = zip(*kwargs.items())
+        # Sort so that the same keywords in any order share a query
+        keys = tuple(sorted(kwargs))
+        values = tuple(kwargs[key] for key in keys)
 
-        cursor = self.connection.cursor()
-        cursor.execute(
-            f"""
-            SELECT {", ".join(("id", *self.Meta.model.Meta.fields))}
-            FROM {self._players}
-            WHERE {" AND ".join(f"{key}=?" for key in keys)}
-            """,
-            values,
-        )
+        with self.query() as cursor:
+            cursor.execute(self._select_player(keys), values)
 
-        result = cursor.fetchone()
-        if result is None:
-            return None
+            result = cursor.fetchone()
+            if result is None:
+                return None
 
-        return self.Meta.model(**dict(zip(("id", *self.Meta.model.Meta.fields), result)))
+            return self.Meta.model(*result)
 
     def update_player(self, player_id: int, **kwargs) -> None:
         """Update a player's data."""
 
-        with self.connection:
-            cursor = self.connection.cursor()
+        with self.transaction() as cursor:
             cursor.execute(
                 f"""
                 UPDATE {self._players}
@@ -135,75 +182,134 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
                 (*kwargs.values(), player_id),
             )
 
-    def get_player_with_user_id(self, guild_id: int, user_id: int) -> Optional[T]:
-        """Get from informal spectator tagging."""
-
-        cursor = self.connection.cursor()
-        cursor.execute(
-            f"""
-            SELECT {", ".join(("id", *self.Meta.model.Meta.fields))}
+    @functools.cached_property
+    def _select_player_with_user_id(self) -> str:
+        return f"""
+            SELECT {", ".join(self._columns)}
             FROM {self._spectators}
             LEFT JOIN {self._players}
             ON {self._spectators}.player_id={self._players}.id
             WHERE guild_id=? AND user_id=?
-            """,
-            (guild_id, user_id),
-        )
+            """
 
-        result = cursor.fetchone()
-        if result is None:
-            return None
+    def get_player_with_user_id(self, guild_id: int, user_id: int) -> Optional[T]:
+        """Get from informal spectator tagging."""
 
-        return self.Meta.model(**dict(zip(("id", *self.Meta.model.Meta.fields), result)))
+        with self.query() as cursor:
+            cursor.execute(self._select_player_with_user_id, (guild_id, user_id))
 
-    def get_players_spectated_by_guild(self, guild_id: int = None) -> Iterator[SpectatedPlayer[T]]:
-        """Iterate through all players spectated by a specified guild."""
+            result = cursor.fetchone()
+            if result is None:
+                return None
 
-        cursor = self.connection.cursor()
+            return self.Meta.model(*result)
 
-        # Select all players where there's at least one watch list
-        # entry pointing to their id; we SELECT DISTINCT because JOIN
-        # will yield a row for every watching guild.
-        cursor.execute(
-            f"""
-            SELECT DISTINCT {", ".join(("id", *self.Meta.model.Meta.fields))}, user_id
-            FROM {self._spectators}
-            LEFT JOIN {self._players} 
-            ON {self._spectators}.player_id={self._players}.id
-            WHERE guild_id=?;
-            """,
-            (guild_id,),
-        )
-        # For example, if you have player A spectated by guilds X and Y,
-        # and player B spectated by nobody, you'll get two rows back:
-        #
-        #   A X
-        #   A Y
-        #
-        # We only care about individual players that show up in the
-        # results here.
-
-        for row in cursor.fetchall():
-            yield SpectatedPlayer(
-                self.Meta.model(**dict(zip(("id", *self.Meta.model.Meta.fields), row))),
-                row[-1],
+    def get_players_spectated_by_guild(
+        self,
+        guild_id: int = None,
+        order_by: Optional[str] = None,
+    ) -> Iterator[SpectatedPlayer[T]]:
+        """Iterate through all players spectated by a specified guild.
+
+        The optional `order_by` is a model field optionally followed by
+        `ASC` or `DESC`. It can't be bound as a parameter, so we check
+        it against the model before formatting it into the query.
+        """
+
+        order = ""
+        if order_by is not None:
+            field, _, direction = order_by.partition(" ")
+            if field not in self.Meta.model.Meta.fields or direction.upper() not in ("", "ASC", "DESC"):
+                raise ValueError(f"invalid ordering {order_by!r}")
+            order = f"ORDER BY {order_by}"
+
+        with self.query() as cursor:
+            # Select every player with a watch list entry for this guild.
+            # The unique constraint on (guild_id, player_id) means each
+            # player can only show up once, so there's nothing for a
+            # DISTINCT to remove.
+            cursor.execute(
+                f"""
+                SELECT {", ".join(self._columns)}, user_id
+                FROM {self._spectators}
+                JOIN {self._players}
+                ON {self._spectators}.player_id={self._players}.id
+                WHERE guild_id=?
+                {order};
+                """,
+                (guild_id,),
             )
 
+            for row in cursor:
+                yield SpectatedPlayer(
+                    self.Meta.model(*row[:-1]),
+                    row[-1],
+                )
+
+    @functools.cached_property
+    def _select_spectated_players(self) -> str:
+        return f"""
+            SELECT {", ".join(self._columns)}
+            FROM {self._players}
+            WHERE EXISTS (
+                SELECT 1 FROM {self._spectators}
+                WHERE {self._spectators}.player_id={self._players}.id
+            );
+            """
+
     def get_spectated_players(self) -> Iterator[T]:
         """Iterate through all players spectated by any guild."""
 
-        cursor = self.connection.cursor()
-        cursor.execute(
-            f"""
-            SELECT DISTINCT {", ".join(("id", *self.Meta.model.Meta.fields))}
-            FROM {self._spectators} 
-            LEFT JOIN {self._players} 
-            ON {self._spectators}.player_id={self._players}.id;
+        with self.query() as cursor:
+            cursor.execute(self._select_spectated_players)
+            for row in cursor:
+                yield self.Meta.model(*row)
+
+    @functools.cached_property
+    def _select_spectated_players_with_channels(self) -> str:
+        # Guilds always get a channel when they first add a player, but
+        # LEFT JOIN anyway so a missing one can't hide the player.
+        return f"""
+            SELECT {", ".join(self._columns)}, {self._spectators}.guild_id, channel_id, user_id
+            FROM {self._players}
+            JOIN {self._spectators}
+            ON {self._spectators}.player_id={self._players}.id
+            LEFT JOIN {self._channels}
+            ON {self._channels}.guild_id={self._spectators}.guild_id
+            ORDER BY {self._players}.id;
             """
-        )
 
-        for row in cursor.fetchall():
-            yield self.Meta.model(**dict(zip(("id", *self.Meta.model.Meta.fields), row)))
+    def get_spectated_players_with_channels(self) -> Dict[T, List[SpectatorChannel]]:
+        """Map every spectated player to the channels to notify.
+
+        Equivalent to calling `get_spectator_channels` for each of the
+        `get_spectated_players`, but in a single query.
+        """
+
+        size = len(self._columns)
+        players = {}
+        player = None
+        with self.query() as cursor:
+            cursor.execute(self._select_spectated_players_with_channels)
+            for row in cursor:
+                # Rows are ordered by player, so each one's channels
+                # arrive together.
+                if player is None or player.id != row[0]:
+                    player = self.Meta.model(*row[:size])
+                    players[player] = []
+                if row[size + 1] is not None:
+                    players[player].append(SpectatorChannel(*row[size:]))
+        return players
+
+    @functools.cached_property
+    def _delete_players_without_spectator(self) -> str:
+        return f"""
+            DELETE FROM {self._players}
+            WHERE NOT EXISTS (
+                SELECT 1 FROM {self._spectators}
+                WHERE {self._spectators}.player_id={self._players}.id
+            )
+            """
 
     def delete_players_without_spectator(self) -> int:
         """Remove all player rows with no watching guilds.
@@ -212,14 +318,8 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
         down over the long term.
         """
 
-        with self.connection:
-            cursor = self.connection.cursor()
-            cursor.execute(
-                f"""
-                DELETE FROM {self._players} 
-                WHERE id NOT IN (SELECT DISTINCT player_id FROM {self._spectators})
-                """
-            )
+        with self.transaction() as cursor:
+            cursor.execute(self._delete_players_without_spectator)
             return cursor.rowcount
 
     def create_spectators_table(self):
@@ -230,34 +330,62 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
         # is updated, that guild should receive a notification. This
         # allows multiple guilds to watch a single player without
         # incurring redundant raider.io API queries.
-        self.connection.execute(
-            f"""
-            CREATE TABLE IF NOT EXISTS {self._spectators} (
-                guild_id INTEGER NOT NULL,
-                player_id INTEGER NOT NULL,
-                user_id INTEGER,
-                FOREIGN KEY(player_id) REFERENCES {self._players}(id),
-                UNIQUE (guild_id, player_id)
+        with self.transaction() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._spectators} (
+                    guild_id INTEGER NOT NULL,
+                    player_id INTEGER NOT NULL,
+                    user_id INTEGER,
+                    FOREIGN KEY(player_id) REFERENCES {self._players}(id),
+                    UNIQUE (guild_id, player_id)
+                )
+                """
             )
+
+            # The unique constraint only indexes lookups that lead with
+            # guild_id; notifications and cleanup filter by player_id.
+            # Carrying guild_id as well lets the channel join read it
+            # straight from the index.
+            cursor.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS {self._spectators}_player_id_guild_id
+                ON {self._spectators} (player_id, guild_id)
+                """
+            )
+
+    @functools.cached_property
+    def _restore_player(self) -> str:
+        fields = self.Meta.model.Meta.fields
+        return f"""
+            INSERT OR IGNORE INTO {self._players} (id, {", ".join(fields)})
+            VALUES ({", ".join(("?",) * (len(fields) + 1))})
             """
-        )
 
-    def create_spectator(self, guild_id: int, player_id: int, user_id: Optional[int] = None) -> bool:
-        """Add a player to a guild watch list."""
+    def create_spectator(self, guild_id: int, player: T, user_id: Optional[int] = None) -> bool:
+        """Add a player to a guild watch list.
+
+        Players without spectators are pruned in the background, so one
+        may disappear between being looked up or created and getting its
+        first spectator. Reinsert it in the same transaction so the
+        spectator always has a player to reference.
+        """
 
-        with self.connection:
-            cursor = self.connection.cursor()
+        with self.transaction() as cursor:
+            cursor.execute(
+                self._restore_player,
+                (player.id, *(getattr(player, field) for field in self.Meta.model.Meta.fields)),
+            )
             cursor.execute(
                 f"INSERT OR IGNORE INTO {self._spectators} (guild_id, player_id, user_id) VALUES (?, ?, ?)",
-                (guild_id, player_id, user_id),
+                (guild_id, player.id, user_id),
             )
             return cursor.rowcount > 0
 
     def delete_spectator(self, guild_id: int, player_id: int) -> bool:
         """Remove a player from the guild watch list."""
 
-        with self.connection:
-            cursor = self.connection.cursor()
+        with self.transaction() as cursor:
             cursor.execute(
                 f"DELETE FROM {self._spectators} WHERE guild_id=? AND player_id=?",
                 (guild_id, player_id),
@@ -270,15 +398,16 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
         # This table links guilds to one of their text channels. We
         # use it to determine where player rating notifications should
         # be posted.
-        self.connection.execute(
-            f"""
-            CREATE TABLE IF NOT EXISTS {self._channels} (
-                guild_id INTEGER NOT NULL,
-                channel_id INTEGER NOT NULL,
-                UNIQUE (guild_id)
+        with self.transaction() as cursor:
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {self._channels} (
+                    guild_id INTEGER NOT NULL,
+                    channel_id INTEGER NOT NULL,
+                    UNIQUE (guild_id)
+                )
+                """
             )
-            """
-        )
 
     def set_channel_if_unset(self, guild_id: int, channel_id: int):
         """Set notification channel for a guild only if unset.
@@ -290,8 +419,7 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
         until after that point.
         """
 
-        with self.connection:
-            cursor = self.connection.cursor()
+        with self.transaction() as cursor:
             cursor.execute(
                 f"INSERT OR IGNORE INTO {self._channels} (guild_id, channel_id) VALUES (?, ?)",
                 (guild_id, channel_id),
@@ -304,8 +432,7 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
         any previous channel.
         """
 
-        with self.connection:
-            cursor = self.connection.cursor()
+        with self.transaction() as cursor:
             cursor.execute(
                 f"""
                 INSERT INTO {self._channels} (guild_id, channel_id)
@@ -315,22 +442,23 @@ class Tracker(Generic[T], metaclass=abc.ABCMeta):
                 (guild_id, channel_id),
             )
 
+    @functools.cached_property
+    def _select_spectator_channels(self) -> str:
+        # Start from the player's few spectator rows via the player_id
+        # index, then probe channels by guild; the filter on player_id
+        # made the old LEFT JOIN an inner join anyway.
+        return f"""
+            SELECT {self._spectators}.guild_id, channel_id, user_id
+            FROM {self._spectators}
+            JOIN {self._channels}
+            ON {self._channels}.guild_id={self._spectators}.guild_id
+            WHERE player_id=?;
+            """
+
     def get_spectator_channels(self, player_id: int) -> Iterator[SpectatorChannel]:
         """Get all channels we should notify of a player update."""
 
-        cursor = self.connection.cursor()
-
-        # Similar logic to the above, exercise for the reader.
-        cursor.execute(
-            f"""
-            SELECT {self._channels}.guild_id, channel_id, user_id
-            FROM {self._channels} 
-            LEFT JOIN {self._spectators} 
-            ON {self._channels}.guild_id={self._spectators}.guild_id 
-            WHERE player_id=?;
-            """,
-            (player_id,),
-        )
-
-        for row in cursor.fetchall():
-            yield SpectatorChannel(*row)
+        with self.query() as cursor:
+            cursor.execute(self._select_spectator_channels, (player_id,))
+            for row in cursor:
+                yield SpectatorChannel(*row)